@@ -0,0 +1,88 @@
+#
+# Library API to convert data in memory without files.
+#
+# Copyright (C) 2012 Satoru SATOH <satoru.satoh at gmail.com>
+# License: MIT
+#
+"""Conversions from and to byte strings in memory:
+
+  csvs_to_xls([csv_data_0, ...]) => xls_data
+  xls_to_csvs(xls_data) => [(sheet_name, csv_data), ...]
+  xls_to_jsons(xls_data) => [(sheet_name, json_data), ...]
+"""
+import cStringIO as StringIO
+
+
+def csvs_to_xls(csvs, sheet_names=[], csv_encoding="utf-8",
+        header_style=False, main_style=False, merged_style=False, **kwargs):
+    """Generate an Excel (.xls) data from CSV data.
+
+    :param csvs: List of CSV data, byte strings or file objects
+    :param sheet_names: Worksheet names ["Sheet 1", ...] by default
+    :param csv_encoding: Character set encoding of the CSV data
+    :param kwargs: Other keyword options passed to
+        CsvsWorkbook.addWorksheetFromCSVFile, e.g. auto_col_width, vmerge
+
+    :return: Excel (.xls) data as a byte string
+    """
+    import xlstools.csvworkbook as CW
+
+    out = StringIO.StringIO()
+
+    with CW.CsvsWorkbook(out, header_style, main_style, merged_style) as wb:
+        for (n, csvdata) in enumerate(csvs):
+            if isinstance(csvdata, basestring):
+                csvdata = StringIO.StringIO(csvdata)
+
+            title = len(sheet_names) > n and sheet_names[n] or False
+            wb.addWorksheetFromCSVFile(csvdata, csv_encoding, title,
+                header_style=header_style, main_style=main_style,
+                merged_style=merged_style, **kwargs)
+
+    return out.getvalue()
+
+
+def xls_to(xls, dumper="csv", names=[], headers=[], dumper_map=None):
+    """Dump data in each worksheet of Excel (.xls) data.
+
+    :param xls: Excel (.xls or .xlsx) data, byte string or file object
+    :param dumper: Dump format, csv or json
+    :param names: Names of worksheets, worksheet names by default
+    :param headers: Headers, cell contents in the 1st row by default
+
+    :return: List of (worksheet name, dumped data as a byte string)
+    """
+    import xlstools.xls2any as XA
+    import xlstools.xlsutils as XU
+
+    if dumper_map is None:
+        dumper_map = XA.DUMPERS
+
+    if not isinstance(xls, basestring):
+        xls = xls.read()
+
+    book = XU.open_workbook(file_contents=xls)
+    ret = []
+
+    for (sheet, name) in XA.sheets_and_names_g(book, names):
+        out = StringIO.StringIO()
+        dumper_map[dumper](sheet, name, headers, stream=out).dump()
+        ret.append((name, out.getvalue()))
+
+    return ret
+
+
+def xls_to_csvs(xls, names=[], headers=[]):
+    """Dump data in each worksheet of Excel (.xls) data as CSV.
+    See xls_to() also.
+    """
+    return xls_to(xls, "csv", names, headers)
+
+
+def xls_to_jsons(xls, names=[], headers=[]):
+    """Dump data in each worksheet of Excel (.xls) data as JSON.
+    See xls_to() also.
+    """
+    return xls_to(xls, "json", names, headers)
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,67 @@
+#
+# xlstools - Unified front-end of the tools in this package.
+#
+# Copyright (C) 2012 Satoru SATOH <satoru.satoh at gmail.com>
+# License: MIT
+#
+"""Unified front-end runs the sub command given in the first argument.
+
+Modules of sub commands are imported only when these are run, and these
+import heavy modules (xlrd, xlwt, sqlite3, json, duckdb, etc.) in functions
+using them instead of at the top, to make the startup fast.
+"""
+import os.path
+import sys
+
+
+COMMANDS = dict(
+    csvs2xls="xlstools.csvs2xls",
+    xls2any="xlstools.xls2any",
+    xlsdiff="xlstools.xlsdiff",
+    xlsto="xlstools.xlsto",
+)
+
+USAGE = """Usage: %(prog)s COMMAND [OPTION ...] [ARGS ...]
+
+Commands:
+  csvs2xls  Generate an Excel (.xls) file from CSV files
+  xls2any   Generate CSV/JSON files from an Excel (.xls) file
+  xlsdiff   Compare Excel (.xls) files and report changed rows
+  xlsto     Convert Excel files to a database or CSV files with spec
+
+Run '%(prog)s COMMAND --help' for the usage of each command.
+"""
+
+
+def run(command, args, prog=None):
+    """Run the sub command with args.
+
+    :param command: Sub command name, one of COMMANDS
+    :param args: Arguments passed to the sub command
+    :param prog: Program name shown in the usage, command name by default
+    """
+    module = __import__(COMMANDS[command], fromlist=["main"])
+    sys.argv = [prog or command] + list(args)
+    module.main()
+
+
+def main(argv=sys.argv):
+    prog = os.path.basename(argv[0])
+
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
+        print USAGE % dict(prog=prog)
+        sys.exit(0)
+
+    command = argv[1]
+    if command not in COMMANDS:
+        print >> sys.stderr, "Unknown command '%s'" % command
+        print >> sys.stderr, USAGE % dict(prog=prog)
+        sys.exit(-1)
+
+    run(command, argv[2:], "%s %s" % (prog, command))
+
+
+if __name__ == '__main__':
+    main()
+
+# vim:sw=4:ts=4:et:
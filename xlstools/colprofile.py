@@ -0,0 +1,222 @@
+#
+# Profile columns of rows in a single pass.
+#
+# Copyright (C) 2012 Satoru SATOH <satoru.satoh at gmail.com>
+# License: MIT
+#
+"""Column statistics computed while rows are dumped, so that data need not
+be read again to profile it:
+
+{
+  "name": NAME,
+  "rows": number_of_rows,
+  "columns": [
+    {"name": header, "type": inferred SQL type, "count": non-empty cells,
+     "nulls": empty cells, "distinct": estimated number of distinct values,
+     "min": min_value, "max": max_value, "types": {SQL type: cells, ...}},
+    ...
+  ]
+}
+
+Memory usage is bounded; the number of distinct values is estimated with
+HyperLogLog (about 1.6% standard error) instead of keeping values.
+"""
+import xlstools.utils as U
+
+import math
+
+
+MASK64 = (1 << 64) - 1
+
+
+def fmix64(h):
+    """Finalizer of MurmurHash3 to mix bits of hash(), which is not uniform,
+    e.g. hash(n) == n for small integers.
+
+    >>> fmix64(1) != fmix64(2)
+    True
+    """
+    h &= MASK64
+    h ^= h >> 33
+    h = (h * 0xff51afd7ed558ccd) & MASK64
+    h ^= h >> 33
+    h = (h * 0xc4ceb9fe1a85ec53) & MASK64
+    h ^= h >> 33
+
+    return h
+
+
+class HyperLogLog(object):
+
+    def __init__(self, p=12):
+        """
+        :param p: Precision; 2^p registers (bytes) are used
+        """
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        h = fmix64(hash(value))
+        idx = h >> (64 - self.p)
+        rest = (h << self.p) & MASK64
+        rank = min(64 - rest.bit_length(), 64 - self.p) + 1
+
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def count(self):
+        """Returns the estimated number of distinct values added.
+
+        >>> hll = HyperLogLog()
+        >>> for i in xrange(100): hll.add(i % 10)
+        >>> hll.count()
+        10
+        >>> for i in xrange(100000): hll.add(float(i))
+        >>> abs(hll.count() - 100000) < 5000
+        True
+        """
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        zeros = self.registers.count("\0")
+        if estimate <= 2.5 * m and zeros:  # Linear counting for small sets.
+            estimate = m * math.log(m / float(zeros))
+
+        return int(round(estimate))
+
+
+def value_type(value):
+    """Returns the SQL type of the value (see utils.SQL_TYPES) or None if it
+    is empty. Times without dates are TEXT as xlsto stores these as strings.
+
+    >>> value_type(1.0), value_type(1.5), value_type(u"a"), value_type("")
+    ('INTEGER', 'REAL', 'TEXT', None)
+    >>> value_type((2012, 1, 2, 0, 0, 0)), value_type((2012, 1, 2, 3, 4, 5))
+    ('DATE', 'TIMESTAMP')
+    >>> value_type((0, 0, 0, 12, 0, 0))
+    'TEXT'
+    """
+    if value == "":
+        return None
+    elif isinstance(value, float):
+        return value.is_integer() and 'INTEGER' or 'REAL'
+    elif isinstance(value, (int, long)):  # boolean
+        return 'INTEGER'
+    elif isinstance(value, tuple):  # date
+        if value[:3] == (0, 0, 0):
+            return 'TEXT'
+        return value[3:] == (0, 0, 0) and 'DATE' or 'TIMESTAMP'
+    else:
+        return 'TEXT'
+
+
+def date_str(tpl):
+    """
+    >>> date_str((2012, 1, 2, 0, 0, 0)), date_str((2012, 1, 2, 3, 4, 5))
+    ('2012-01-02', '2012-01-02T03:04:05')
+    >>> date_str((0, 0, 0, 3, 4, 5))
+    '03:04:05'
+    """
+    if tpl[:3] == (0, 0, 0):
+        return "%02d:%02d:%02d" % tpl[3:]
+    elif tpl[3:] == (0, 0, 0):
+        return "%04d-%02d-%02d" % tpl[:3]
+    else:
+        return "%04d-%02d-%02dT%02d:%02d:%02d" % tpl
+
+
+# Kinds of values comparable with each other to find min and max:
+KINDS = dict(INTEGER="number", REAL="number", DATE="date", TIMESTAMP="date",
+    TEXT="text")
+
+
+class ColumnProfile(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.nulls = 0
+        self.types = dict()  # {SQL type: count}
+        self.ranges = dict()  # {kind: [min, max]}
+        self.distinct = HyperLogLog()
+
+    def add(self, value):
+        vtype = value_type(value)
+        if vtype is None:
+            self.nulls += 1
+            return
+
+        if vtype == 'TEXT' and isinstance(value, tuple):  # time
+            value = date_str(value)
+
+        self.types[vtype] = self.types.get(vtype, 0) + 1
+        self.distinct.add(value)
+
+        r = self.ranges.get(KINDS[vtype])
+        if r is None:
+            self.ranges[KINDS[vtype]] = [value, value]
+        elif value < r[0]:
+            r[0] = value
+        elif value > r[1]:
+            r[1] = value
+
+    def result(self):
+        """
+        >>> c = ColumnProfile("a")
+        >>> for v in (3.0, "", 1.0, 2.5, 1.0): c.add(v)
+        >>> r = c.result()
+        >>> r["type"], r["count"], r["nulls"], r["distinct"], r["min"], r["max"]
+        ('REAL', 4, 1, 3, 1.0, 3.0)
+        >>> c = ColumnProfile("b")
+        >>> for v in ((2012, 1, 2, 0, 0, 0), (0, 0, 0, 12, 0, 0)): c.add(v)
+        >>> r = c.result()
+        >>> r["type"], r["min"], r["max"]
+        ('TEXT', '12:00:00', '12:00:00')
+        """
+        ctype = None
+        for t in self.types:
+            ctype = U.unify_types(ctype, t)
+
+        (vmin, vmax) = self.ranges.get(KINDS.get(ctype), [None, None])
+        if ctype in ('DATE', 'TIMESTAMP'):
+            (vmin, vmax) = (date_str(vmin), date_str(vmax))
+
+        return dict(name=self.name, type=ctype, count=sum(self.types.values()),
+            nulls=self.nulls, distinct=self.distinct.count(), min=vmin,
+            max=vmax, types=self.types)
+
+
+class Profiler(object):
+
+    def __init__(self, name, headers):
+        self.name = name
+        self.rows = 0
+        self.columns = [ColumnProfile(h) for h in headers]
+
+    def add_row(self, row):
+        self.rows += 1
+        for (column, value) in zip(self.columns, row):
+            column.add(value)
+
+    def rows_g(self, rows):
+        """Yields rows after profiling each of these.
+        """
+        for row in rows:
+            self.add_row(row)
+            yield row
+
+    def result(self):
+        return dict(name=self.name, rows=self.rows,
+            columns=[c.result() for c in self.columns])
+
+    def dump(self, path):
+        import codecs
+
+        result = self.result()
+
+        out = codecs.getwriter("utf-8")(open(path, "wb"))
+        U.json_module().dump(result, out, ensure_ascii=False, indent=2)
+        out.close()
+
+# vim:sw=4:ts=4:et:
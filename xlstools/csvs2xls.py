@@ -9,13 +9,170 @@
 label_0, label_1, label_2, ....   => Headers
 value_0, value_1, ...             => Dataset
 ...
-"""
-import xlstools.csvworkbook as CW
 
+Manifest of workbooks to build in the batch mode (JSON, or YAML if the file
+name ends with .yml or .yaml and PyYAML is available):
+
+{
+  "defaults": {"encoding": "utf-8", "main_style": "font: name IPAPGothic"},
+  "workbooks": [
+    {"output": "ABC.xls", "csvs": ["aaa.csv", "bbb.csv", "ccc.csv"],
+     "sheet_names": ["aaa", "bbb", "ccc"], "auto_col_width": true},
+    ...
+  ]
+}
+
+"defaults" (optional) and each workbook may have options of the command,
+encoding, header_style, main_style, merged_style, auto_col_width, vmerge and
+vmerge_col_end; options given in the command line are used if not. Relative
+paths are relative to the dir of the manifest. The list of workbooks may be
+given instead of the dict.
+"""
 import logging
 import optparse
 import os.path
 import sys
+import time
+
+
+# Options of workbooks can be given in the manifest.
+BUILD_OPTIONS = ("encoding", "header_style", "main_style", "merged_style",
+    "auto_col_width", "vmerge", "vmerge_col_end")
+
+
+def build_workbook(output, csvfiles, sheet_names=[], encoding="utf-8",
+        header_style=False, main_style=False, merged_style=False,
+        auto_col_width=False, vmerge=False, vmerge_col_end=-1):
+    """Build the workbook from CSV files.
+
+    :param output: Output file path
+    :param csvfiles: CSV file paths, or "-" to read from stdin
+    :param sheet_names: Worksheet names, CSV file names by default
+    """
+    import xlstools.csvworkbook as CW  # imports xlwt.
+
+    with CW.CsvsWorkbook(output, header_style, main_style) as wb:
+        for (n, csvf) in enumerate(csvfiles):
+            if len(sheet_names) > n:
+                title = sheet_names[n]
+            else:
+                title = os.path.basename(csvf).replace('.csv','')
+
+            wb.addWorksheetFromCSVFile(
+                csvf, csv_encoding=encoding, title=title,
+                main_style=main_style, header_style=header_style,
+                auto_col_width=auto_col_width,
+                vmerge=vmerge, vmerge_col_end=vmerge_col_end,
+                merged_style=merged_style,
+            )
+
+
+def load_manifest(path):
+    if path.endswith((".yml", ".yaml")):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("YAML support is disabled as yaml module not found.")
+
+        return yaml.safe_load(open(path))
+
+    import xlstools.utils as U
+
+    return U.json_module().load(open(path))
+
+
+def manifest_jobs(manifest, basedir=os.curdir, defaults={}):
+    """Returns the list of keyword arguments of build_workbook() to build
+    workbooks in the manifest.
+
+    >>> m = {"defaults": {"encoding": "sjis"},
+    ...      "workbooks": [{"output": "a.xls", "csvs": ["a.csv", "/t/b.csv"]}]}
+    >>> jobs = manifest_jobs(m, "/d", dict(encoding="utf-8", vmerge=True))
+    >>> jobs[0]["output"], jobs[0]["csvfiles"], jobs[0]["encoding"]
+    ('/d/a.xls', ['/d/a.csv', '/t/b.csv'], 'sjis')
+    >>> jobs[0]["vmerge"], jobs[0]["sheet_names"]
+    (True, [])
+    """
+    if isinstance(manifest, dict):
+        defaults = dict(defaults, **manifest.get("defaults", {}))
+        workbooks = manifest.get("workbooks", [])
+    else:
+        workbooks = manifest
+
+    path = lambda f: f == "-" and f or os.path.join(basedir, f)
+
+    jobs = []
+    for wb in workbooks:
+        job = dict((k, wb.get(k, defaults.get(k))) for k in BUILD_OPTIONS
+            if k in wb or k in defaults)
+        job["output"] = path(wb["output"])
+        job["csvfiles"] = [path(f) for f in wb.get("csvs", [])]
+        job["sheet_names"] = wb.get("sheet_names", [])
+        jobs.append(job)
+
+    return jobs
+
+
+def init_worker(styles=()):
+    """Import modules and parse styles once in each worker process, not for
+    each workbook.
+    """
+    import xlstools.csvworkbook as CW
+
+    for style in styles:
+        if style:
+            CW.easyxf(style)
+
+
+def run_job(job):
+    """Build the workbook and returns the result, (output, seconds, error).
+    """
+    start = time.time()
+    try:
+        build_workbook(**job)
+        error = None
+    except Exception, e:
+        logging.info("Failed to build: %s" % job["output"], exc_info=True)
+        error = "%s: %s" % (e.__class__.__name__, e)
+
+    return (job["output"], time.time() - start, error)
+
+
+def batch(manifest_path, defaults={}, processes=None):
+    """Build workbooks in the manifest with a pool of processes and report
+    the time to build each and failures.
+
+    :param processes: Number of worker processes, number of CPUs by default
+    :return: Number of workbooks failed to build
+    """
+    manifest = load_manifest(manifest_path)
+    jobs = manifest_jobs(manifest, os.path.dirname(manifest_path), defaults)
+    styles = set(j.get(k) for j in jobs for k in
+        ("header_style", "main_style", "merged_style"))
+
+    start = time.time()
+    if processes == 1:
+        init_worker(styles)
+        results = (run_job(j) for j in jobs)
+    else:
+        import multiprocessing
+
+        pool = multiprocessing.Pool(processes, init_worker, (list(styles), ))
+        results = pool.imap(run_job, jobs)
+        pool.close()
+
+    failed = 0
+    for (output, seconds, error) in results:
+        if error is None:
+            print "ok      %7.3fs %s" % (seconds, output)
+        else:
+            print "FAILED  %7.3fs %s: %s" % (seconds, output, error)
+            failed += 1
+
+    print "%d workbooks built, %d failed in %.3fs" % \
+        (len(jobs) - failed, failed, time.time() - start)
+
+    return failed
 
 
 def opts_parser():
@@ -34,6 +191,7 @@ Examples:
   %prog aaa.csv bbb.csv ccc.csv ABC.xls
   %prog - output.xls  # read csv data from stdin
   %prog --main-style 'font: name IPAPGothic' --sheet-names "aaa,bbb" A.csv B.csv AB.xls
+  %prog --batch reports.json --jobs 4  # build workbooks in the manifest
     """)
     p.set_defaults(**defaults)
 
@@ -71,12 +229,19 @@ Examples:
             "ex. 'vert center', 'horiz center' [%default]")
     p.add_option_group(sog)
 
+    bog = optparse.OptionGroup(p, "Batch Mode Options")
+    bog.add_option('', '--batch', metavar="MANIFEST",
+        help='Build workbooks listed in the manifest (JSON or YAML) instead, '
+            'with options above as defaults')
+    bog.add_option('', '--jobs', type="int",
+        help='Number of worker processes in the batch mode [number of CPUs]')
+    p.add_option_group(bog)
+
     return p
 
 
 def main():
     loglevel = logging.WARN
-    sheet_names = {}
 
     p = opts_parser()
     (options, args) = p.parse_args()
@@ -89,6 +254,10 @@ def main():
 
     logging.basicConfig(level=loglevel)
 
+    if options.batch:
+        defaults = dict((k, getattr(options, k)) for k in BUILD_OPTIONS)
+        sys.exit(batch(options.batch, defaults, options.jobs) and 1 or 0)
+
     if len(args) < 2:
         p.print_help()
         sys.exit(0)
@@ -97,20 +266,12 @@ def main():
     output = args[-1]
 
     if options.sheet_names:
-        sheet_names = dict(zip(csvfiles, options.sheet_names.split(',')))
-
-    wb = CW.CsvsWorkbook(output, options.header_style, options.main_style)
-    for csvf in csvfiles:
-        title = sheet_names.get(csvf, os.path.basename(csvf).replace('.csv',''))
-        wb.addWorksheetFromCSVFile(
-            csvf, csv_encoding=options.encoding, title=title,
-            main_style=options.main_style, header_style=options.header_style,
-            auto_col_width=options.auto_col_width, 
-            vmerge=options.vmerge, vmerge_col_end=options.vmerge_col_end,
-            merged_style=options.merged_style,
-        )
-
-    wb.save()
+        sheet_names = options.sheet_names.split(',')
+    else:
+        sheet_names = []
+
+    build_workbook(output, csvfiles, sheet_names,
+        **dict((k, getattr(options, k)) for k in BUILD_OPTIONS))
 
 
 if __name__ == '__main__':
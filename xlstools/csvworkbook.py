@@ -2,15 +2,41 @@
 # Copyright (C) 2010 - 2012 Satoru SATOH <satoru.satoh at gmail.com>
 # License: MIT
 #
-from xlstools.utils import adjust_width, max_col_widths, mergeable_cells
+from xlstools.utils import adjust_width, mergeable_cells, Interner
 
+import copy
 import csv
+import datetime
+import decimal
 import logging
 import sys
 import xlwt
 
 
+_STYLES = dict()  # Cache of parsed styles: {style string: XFStyle}
+
+
+def easyxf(style_string):
+    """Returns the style parsed from the string with xlwt.easyxf(). Parsed
+    styles are cached and shared across workbooks built in the process, as
+    xlwt does not modify styles.
+    """
+    style = _STYLES.get(style_string)
+    if style is None:
+        style = _STYLES[style_string] = xlwt.easyxf(style_string)
+
+    return style
+
+
 class CsvsWorkbook(object):
+    """Workbook built from CSV files or rows.
+
+    The workbook is written to the file (path or file object) when save() is
+    called, or on exit if it is used as a context manager:
+
+        with CsvsWorkbook("output.xls") as wb:
+            wb.addWorksheetFromCSVFile("a.csv")
+    """
 
     default_styles = dict(
         header="font: name Times New Roman, bold on",
@@ -18,11 +44,19 @@ class CsvsWorkbook(object):
         merged="align: wrap yes, vert center, horiz center",
     )
 
+    # Number formats of date and time values, applied to the main style.
+    date_formats = (
+        (datetime.datetime, "YYYY-MM-DD HH:MM:SS"),
+        (datetime.date, "YYYY-MM-DD"),
+        (datetime.time, "HH:MM:SS"),
+    )
+
     def __init__(self, filename, header_style=False, main_style=False,
             merged_style=False):
         self._filename = filename
         self._workbook = xlwt.Workbook()
         self._sheets = 0
+        self._saved = False
         self.__init_styles(header_style, main_style, merged_style)
 
     def __init_styles(self, header_style, main_style, merged_style):
@@ -37,12 +71,16 @@ class CsvsWorkbook(object):
         setattr(self, "_%s_style" % style_name, \
             self.__to_style(style_name, style))
 
-    def __del__(self):
-        self._workbook.save(self._filename)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and not self._saved:
+            self.save()
 
     def __to_style(self, style_name, style_string):
         try:
-            style = xlwt.easyxf(style_string)
+            style = easyxf(style_string)
             assert isinstance(style, xlwt.Style.XFStyle)
         except:
             logging.warn(
@@ -52,12 +90,15 @@ class CsvsWorkbook(object):
             ss = self.default_styles.get(
                 style_name, self.default_styles['main']
             )
-            style = xlwt.easyxf(ss)
+            style = easyxf(ss)
 
         return style
 
     def save(self):
+        """Write the workbook to the file path or the file object.
+        """
         self._workbook.save(self._filename)
+        self._saved = True
 
     def header_style(self):
         return self._header_style
@@ -71,6 +112,25 @@ class CsvsWorkbook(object):
     def sheets(self):
         return self._sheets + 1
 
+    def __style(self, style_name, style):
+        """Returns the style from given style string or the default one.
+        """
+        if style:
+            return self.__to_style(style_name, style)
+
+        return getattr(self, "_%s_style" % style_name)
+
+    def __date_styles(self, style):
+        """Returns a list of (date type, style) pairs derived from style.
+        """
+        ret = []
+        for (dtype, fmt) in self.date_formats:
+            dstyle = copy.copy(style)
+            dstyle.num_format_str = fmt
+            ret.append((dtype, dstyle))
+
+        return ret
+
     def addWorksheetFromCSVFile(self, csv_filename, csv_encoding='utf-8',
             title=False, fieldnames=[], header_style=False,
             main_style=False, auto_col_width=False,
@@ -80,29 +140,36 @@ class CsvsWorkbook(object):
 
         _conv = lambda x: unicode(x, csv_encoding)
 
-        if header_style:
-            hstyle = self.__to_style('header', header_style)
-        else:
-            hstyle = self.header_style()
-
-        if main_style:
-            mstyle = self.__to_style('main', main_style)
-        else:
-            mstyle = self.main_style()
-
-        if merged_style:
-            mgstyle = self.__to_style('merged', merged_style)
-        else:
-            mgstyle = self.merged_style()
+        hstyle = self.__style('header', header_style)
+        mstyle = self.__style('main', main_style)
+        mgstyle = self.__style('merged', merged_style)
 
         if csv_filename == "-":
             csvf = sys.stdin
+        elif hasattr(csv_filename, "read"):
+            csvf = csv_filename  # file object given; do not close it.
         else:
             csvf = open(csv_filename) 
             
+        # Decode values and intern these as these are read, so that repeated
+        # values share a decoded object and are decoded only once.
+        intern = Interner(_conv)
         reader = csv.reader(csvf)
-        cells = [row for row in reader]
-        csvf.close()
+        cells = []
+        mcws = []  # max width of each column (ignore header columns).
+
+        for row in reader:
+            if auto_col_width and cells:
+                for (i, x) in enumerate(row):
+                    if i < len(mcws):
+                        mcws[i] = max(mcws[i], len(x))
+                    else:
+                        mcws.append(len(x))
+
+            cells.append([intern(i, x) for (i, x) in enumerate(row)])
+
+        if csvf is not csv_filename:
+            csvf.close()
 
         (headers, dataset) = (cells[0], cells)
 
@@ -115,13 +182,14 @@ class CsvsWorkbook(object):
 
         for col in range(0, len(fieldnames)):
             logging.info(" col=%d, fieldname=%s" % (col, fieldnames[col]))
-            worksheet.write(0, col, _conv(fieldnames[col]), hstyle)
+            fieldname = fieldnames[col]
+            if isinstance(fieldname, str):
+                fieldname = _conv(fieldname)
+            worksheet.write(0, col, fieldname, hstyle)
 
         # @FIXME: Tune factor and threashold values.
         if auto_col_width:
-            mcws = max_col_widths(dataset[1:])  # ignore header columns.
-
-            for i in range(0, len(dataset[0])):
+            for i in range(0, min(len(dataset[0]), len(mcws))):
                 w = adjust_width(mcws[i])
                 logging.info(" col[%d].width=%d [%d](adjusted [original])" % (i, w, mcws[i]))
                 worksheet.col(i).width = w
@@ -131,18 +199,120 @@ class CsvsWorkbook(object):
 
         if vmerge:
             for ms in mergeable_cells(dataset, 1, col_end=vmerge_col_end):
-                worksheet.write_merge(ms[1], ms[2], ms[3], ms[4], _conv(ms[0]), mgstyle)
+                worksheet.write_merge(ms[1], ms[2], ms[3], ms[4], ms[0], mgstyle)
 
         for row in range(1, rows):
             for col in range(0, len(dataset[row])):
                 logging.info(" row=%d, col=%d, data=%s" % (row, col, dataset[row][col]))
                 if vmerge:
                     try:
-                        worksheet.write(row, col, _conv(dataset[row][col]) or "", mstyle)
+                        worksheet.write(row, col, dataset[row][col], mstyle)
                     except:
                         logging.info("The cell (row=%d, col=%d) is a part of merged cells." % (row, col))
                         pass   # skip this cell as it was written as merged cells before.
                 else:
-                    worksheet.write(row, col, _conv(dataset[row][col]) or "", mstyle)
+                    worksheet.write(row, col, dataset[row][col], mstyle)
+
+    def addWorksheetFromRows(self, rows, headers=[], title=False,
+            encoding='utf-8', header_style=False, main_style=False,
+            auto_col_width=False, batch_size=1000):
+        """Add a worksheet from rows and write these into it one by one.
+
+        :param rows: Any iterable yields rows (sequences of values), or DB-API
+            cursor object from which rows are fetched by fetchmany()
+        :param headers: Header fields. Column names in the cursor's
+            description are used if not given and rows is a cursor.
+        :param encoding: Character set encoding of byte string values
+        :param batch_size: Number of rows to fetch at once from the cursor
+
+        Values are written with their types kept; numbers as numbers, dates
+        and times as dates and times formatted in the main style, and None
+        as empty cells.
+        """
+        if not title:
+            title = "Sheet %d" % (self.sheets())
+
+        hstyle = self.__style('header', header_style)
+        mstyle = self.__style('main', main_style)
+        dstyles = self.__date_styles(mstyle)
+
+        if not headers and getattr(rows, "description", None):
+            headers = [d[0] for d in rows.description]
+
+        if hasattr(rows, "fetchmany"):
+            rows = fetchmany_g(rows, batch_size)
+
+        worksheet = self._workbook.add_sheet(title)
+        self._sheets += 1
+
+        widths = []
+        row_start = 0
+
+        if headers:
+            xrow = worksheet.row(0)
+            for col, h in enumerate(headers):
+                h = cell_value(h, encoding)
+                xrow.write(col, h, hstyle)
+                widths.append(len(h))
+            row_start = 1
+
+        for row, values in enumerate(rows, row_start):
+            xrow = worksheet.row(row)
+            for col, v in enumerate(values):
+                v = cell_value(v, encoding)
+                if v is None:
+                    continue
+
+                style = mstyle
+                for (dtype, dstyle) in dstyles:
+                    if isinstance(v, dtype):
+                        style = dstyle
+                        break
+
+                xrow.write(col, v, style)
+
+                if auto_col_width:
+                    if col >= len(widths):
+                        widths += [0] * (col + 1 - len(widths))
+                    widths[col] = max(widths[col], len(unicode(v)))
+
+        if auto_col_width:
+            for (i, w) in enumerate(widths):
+                worksheet.col(i).width = adjust_width(w)
+
+        return worksheet
+
+
+def fetchmany_g(cursor, size=1000):
+    """Yields rows fetched from DB-API cursor in batches.
+    """
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+
+        for row in rows:
+            yield row
+
+
+def cell_value(value, encoding='utf-8'):
+    """Convert value to the one can be written into cells keeping its type.
+
+    >>> cell_value('abc')
+    u'abc'
+    >>> cell_value(1), cell_value(1.5), cell_value(None)
+    (1, 1.5, None)
+    >>> cell_value(decimal.Decimal('1.5'))
+    1.5
+    """
+    if value is None or isinstance(value, (unicode, bool, int, long, float,
+            datetime.date, datetime.time)):
+        return value
+    elif isinstance(value, str):
+        return unicode(value, encoding)
+    elif isinstance(value, decimal.Decimal):
+        return float(value)
+    else:
+        return unicode(value)
 
 # vim:sw=4:ts=4:et:
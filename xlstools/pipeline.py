@@ -0,0 +1,157 @@
+#
+# Overlap reading and converting rows with writing outputs.
+#
+# Copyright (C) 2012 Satoru SATOH <satoru.satoh at gmail.com>
+# License: MIT
+#
+"""Pipelined dump of rows.
+
+Rows are read and converted in the caller's thread (producer) and passed in
+batches through a bounded queue to a writer thread which encodes and writes
+them (consumer). The producer blocks when the queue is full, so that memory
+usage is bounded by the number of batches in the queue even if the output is
+slower than the input, e.g. on network filesystems.
+
+The writer thread runs while the producer waits for I/O and vice versa, so
+that reading, conversion and writes overlap.
+"""
+import Queue
+import sys
+import threading
+
+
+BATCH_SIZE = 1000  # Number of rows in a batch.
+DEPTH = 8  # Max number of batches in the queue.
+
+_END = object()  # Marks the end of rows in the queue.
+_ABORT = object()  # Marks that the producer failed.
+
+
+class Aborted(Exception):
+    """Raised in the writer when the producer failed, to unwind the writer
+    without finishing the output.
+    """
+    pass
+
+
+def batches_g(rows, size=BATCH_SIZE):
+    """Yields lists of rows have up to size rows each.
+
+    >>> list(batches_g(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    >>> list(batches_g([], 2))
+    []
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+class Pipeline(object):
+
+    def __init__(self, consume, batch_size=BATCH_SIZE, depth=DEPTH):
+        """
+        :param consume: Callable to write rows run in the writer thread, takes
+            an iterable yields rows and its return value is returned from
+            run().
+        :param batch_size: Number of rows passed to the writer at once
+        :param depth: Max number of batches waiting to be written
+        """
+        self.consume = consume
+        self.batch_size = batch_size
+        self.depth = depth
+
+        self._queue = None
+        self._ended = False
+        self._result = None
+        self._error = None
+
+    def _rows_g(self):
+        while True:
+            batch = self._queue.get()
+            if batch is _END:
+                self._ended = True
+                return
+            elif batch is _ABORT:
+                self._ended = True
+                raise Aborted("Reading rows failed")
+
+            for row in batch:
+                yield row
+
+    def _run(self):
+        try:
+            self._result = self.consume(self._rows_g())
+        except:
+            self._error = sys.exc_info()
+
+        # Drain the queue not to block the producer.
+        while not self._ended:
+            self._ended = self._queue.get() in (_END, _ABORT)
+
+    def run(self, rows):
+        """Convert rows in this thread and write them in the writer thread.
+
+        >>> Pipeline(sum, 2, 1).run(xrange(10))
+        45
+        >>> Pipeline(lambda rows: 1 / 0).run(xrange(10))
+        Traceback (most recent call last):
+        ...
+        ZeroDivisionError: integer division or modulo by zero
+
+        If reading rows fails, the writer is aborted with Aborted raised from
+        the rows it iterates, and the error is raised here:
+
+        >>> def rows():
+        ...     yield 1
+        ...     raise KeyError("x")
+        >>> done = []
+        >>> def consume(rows):
+        ...     list(rows)
+        ...     done.append(True)  # Not reached.
+        >>> Pipeline(consume).run(rows())
+        Traceback (most recent call last):
+        ...
+        KeyError: 'x'
+        >>> done
+        []
+        """
+        self._queue = Queue.Queue(self.depth)
+        (self._ended, self._result, self._error) = (False, None, None)
+
+        writer = threading.Thread(target=self._run)
+        writer.setDaemon(True)
+        writer.start()
+
+        try:
+            for batch in batches_g(rows, self.batch_size):
+                if self._error is not None:  # The writer failed.
+                    break
+                self._queue.put(batch)
+        except:
+            exc = sys.exc_info()
+            self._queue.put(_ABORT)
+            writer.join()
+            raise exc[0], exc[1], exc[2]
+
+        self._queue.put(_END)
+        writer.join()
+
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+
+        return self._result
+
+
+def pipe(rows, consume, batch_size=BATCH_SIZE, depth=DEPTH):
+    """Write rows with consume(rows) in the writer thread, see Pipeline.
+    """
+    return Pipeline(consume, batch_size, depth).run(rows)
+
+# vim:sw=4:ts=4:et:
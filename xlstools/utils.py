@@ -4,6 +4,22 @@
 #
 from functools import reduce as fold, partial as curry
 
+import os
+
+
+def json_module():
+    """Returns json module or simplejson if the former is not available.
+    """
+    try:
+        import json
+    except ImportError:
+        try:
+            import simplejson as json
+        except ImportError:
+            raise RuntimeError("JSON support is disabled as json module not found.")
+
+    return json
+
 
 def zipWith(f, xs=[], ys=[]):
     """
@@ -132,6 +148,88 @@ def normalize_key(key):
     return key.lower().strip().replace(' ', '_')
 
 
+SQL_TYPES = ('INTEGER', 'REAL', 'TEXT', 'DATE', 'TIMESTAMP')
+
+
+def unify_types(t0, t1):
+    """Returns the SQL type which can hold values of both types.
+
+    >>> unify_types(None, 'INTEGER')
+    'INTEGER'
+    >>> unify_types('INTEGER', 'REAL')
+    'REAL'
+    >>> unify_types('DATE', 'TIMESTAMP')
+    'TIMESTAMP'
+    >>> unify_types('DATE', 'INTEGER')
+    'TEXT'
+    """
+    if t0 is None or t0 == t1:
+        return t1
+    if t1 is None:
+        return t0
+
+    for ts in (('INTEGER', 'REAL'), ('DATE', 'TIMESTAMP')):
+        if t0 in ts and t1 in ts:
+            return ts[1]
+
+    return 'TEXT'
+
+
+class Interner(object):
+    """Converts (decodes) values and interns the results, so that repeated
+    values share one converted object and are converted only once.
+
+    Interned values are kept in a table per column. Interning is stopped for
+    columns having more distinct values than column_max (high cardinality
+    columns), and all tables are cleared if the number of interned values
+    exceeds maxsize, to bound memory used for the tables.
+
+    >>> intern = Interner(lambda x: unicode(x, 'utf-8'), column_max=2)
+    >>> a = intern(0, 'abc')
+    >>> a
+    u'abc'
+    >>> intern(0, ''.join(['ab', 'c'])) is a
+    True
+    >>> (intern(0, 'x'), intern(0, 'y'))  # column 0 exceeds column_max.
+    (u'x', u'y')
+    >>> intern(0, 'abc') is a
+    False
+    """
+
+    def __init__(self, conv, maxsize=1000000, column_max=10000):
+        self._conv = conv
+        self.maxsize = maxsize
+        self.column_max = column_max
+        self._tables = dict()  # {column: {value: converted value}}
+        self._size = 0
+
+    def __call__(self, column, value):
+        table = self._tables.get(column)
+
+        if table is None:
+            if column in self._tables:  # Interning was stopped.
+                return self._conv(value)
+
+            table = self._tables[column] = dict()
+
+        ret = table.get(value)
+        if ret is not None:
+            return ret
+
+        ret = table[value] = self._conv(value)
+        self._size += 1
+
+        if len(table) > self.column_max:
+            self._size -= len(table)
+            self._tables[column] = None
+        elif self._size > self.maxsize:
+            self._tables = dict((c, t is None and None or dict()) for c, t
+                in self._tables.iteritems())
+            self._size = 0
+
+        return ret
+
+
 def rename_if_exists(target, suffix='.bak'):
     """
     If the file $target (file or dir) exists, it will be renamed and backed
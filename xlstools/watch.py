@@ -0,0 +1,251 @@
+#
+# Watch a directory and convert files dropped into it.
+#
+# Copyright (C) 2012 Satoru SATOH <satoru.satoh at gmail.com>
+# License: MIT
+#
+"""Long-running (daemon) mode of xls2any and xlsto.
+
+Files dropped into (or changed in) the watched directory are converted by a
+pool of worker threads in this process, so that imported modules, parsed
+specs and so on are kept warm across files.
+
+Changes are detected with inotify if pyinotify is available, or by polling
+the directory otherwise.
+"""
+import xlstools.utils as U
+
+import logging
+import optparse
+import os
+import os.path
+import threading
+import time
+
+
+def pyinotify_module():
+    """Returns pyinotify module or None if it is not available.
+    """
+    try:
+        import pyinotify
+    except ImportError:
+        pyinotify = None
+
+    return pyinotify
+
+
+class Watcher(object):
+
+    def __init__(self, watchdir, handler, suffixes=(".xls", ), workers=2,
+            interval=1.0, stats_file=None, inotify=True):
+        """
+        :param watchdir: Directory to watch
+        :param handler: Callable to convert a file, takes the file path
+        :param suffixes: Suffixes of files to convert
+        :param workers: Number of worker threads
+        :param interval: Polling interval in seconds
+        :param stats_file: Path to dump counters in JSON periodically
+        :param inotify: Use inotify if available
+        """
+        self.watchdir = watchdir
+        self.handler = handler
+        self.suffixes = suffixes
+        self.workers = workers
+        self.interval = interval
+        self.stats_file = stats_file
+        self.inotify = inotify
+
+        self._pool = None
+        self._lock = threading.Lock()
+        self._running = set()  # files being converted.
+        self._dirty = set()  # files changed again while being converted.
+        self._seen = dict()  # path: (mtime, size)
+        self._candidates = dict()
+
+        self._started = time.time()
+        self._processed = 0
+        self._failed = 0
+        self._busy = 0.0
+        self._last = None
+
+    def target(self, path):
+        return os.path.isfile(path) and path.endswith(self.suffixes)
+
+    def stats(self):
+        """Returns counters; number of files processed and failed, files
+        waiting or being converted (backlog) and throughput (files/sec).
+        """
+        with self._lock:
+            elapsed = time.time() - self._started
+            return dict(
+                processed=self._processed, failed=self._failed,
+                backlog=len(self._running) + len(self._dirty),
+                elapsed=elapsed, busy=self._busy,
+                throughput=(elapsed and self._processed / elapsed or 0.0),
+            )
+
+    def dump_stats(self):
+        stats = self.stats()
+        counts = (stats["processed"], stats["failed"], stats["backlog"])
+        if counts == self._last:
+            return
+
+        self._last = counts
+        logging.info(
+            "processed=%(processed)d, failed=%(failed)d, backlog=%(backlog)d, "
+            "throughput=%(throughput).2f files/sec" % stats
+        )
+
+        if self.stats_file:
+            tmp = self.stats_file + ".tmp"
+            out = open(tmp, "w")
+            U.json_module().dump(stats, out)
+            out.close()
+            os.rename(tmp, self.stats_file)
+
+    def submit(self, path):
+        if not self.target(path):
+            return
+
+        with self._lock:
+            if path in self._running:
+                self._dirty.add(path)
+                return
+
+            self._running.add(path)
+
+        logging.info("Queued: %s" % path)
+        self._pool.apply_async(self._process, (path, ))
+
+    def _process(self, path):
+        start = time.time()
+        failed = False
+
+        try:
+            self.handler(path)
+            logging.info("Converted: %s" % path)
+        except Exception:
+            logging.exception("Failed to convert: %s" % path)
+            failed = True
+
+        with self._lock:
+            self._processed += 1
+            self._failed += int(failed)
+            self._busy += time.time() - start
+            self._running.discard(path)
+
+            again = path in self._dirty
+            self._dirty.discard(path)
+
+        if again:
+            self.submit(path)
+
+    def scan(self):
+        """Scan the dir and submit new or changed files. Files are submitted
+        when its mtime and size are not changed since the last scan to avoid
+        converting files being written.
+        """
+        for f in os.listdir(self.watchdir):
+            path = os.path.join(self.watchdir, f)
+            if not self.target(path):
+                continue
+
+            st = os.stat(path)
+            sig = (st.st_mtime, st.st_size)
+
+            if self._seen.get(path) == sig:
+                continue
+
+            if self._candidates.get(path) == sig:
+                del self._candidates[path]
+                self._seen[path] = sig
+                self.submit(path)
+            else:
+                self._candidates[path] = sig
+
+    def _run_inotify(self, pyinotify):
+        submit = self.submit
+
+        class Handler(pyinotify.ProcessEvent):
+
+            def process_default(self, event):
+                submit(event.pathname)
+
+        wm = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(wm, Handler(),
+            timeout=int(self.interval * 1000))
+        wm.add_watch(self.watchdir,
+            pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO)
+
+        for f in os.listdir(self.watchdir):
+            self.submit(os.path.join(self.watchdir, f))
+
+        try:
+            while True:
+                if notifier.check_events():
+                    notifier.read_events()
+                    notifier.process_events()
+                self.dump_stats()
+        finally:
+            notifier.stop()
+
+    def _run_polling(self):
+        while True:
+            self.scan()
+            self.dump_stats()
+            time.sleep(self.interval)
+
+    def run(self):
+        """Watch the dir and convert files until interrupted.
+        """
+        from multiprocessing.pool import ThreadPool
+
+        pyinotify = self.inotify and pyinotify_module() or None
+        logging.info("Watching %s (%s, workers=%d)" % (self.watchdir,
+            pyinotify and "inotify" or "polling", self.workers))
+
+        self._pool = ThreadPool(self.workers)
+        try:
+            if pyinotify:
+                self._run_inotify(pyinotify)
+            else:
+                self._run_polling()
+        except KeyboardInterrupt:
+            logging.info("Interrupted. Waiting for conversions in progress")
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self.dump_stats()
+
+
+def watch_options_group(parser):
+    """Returns an option group for the watch mode to add to parser.
+    """
+    parser.set_defaults(watch=None, workers=2, interval=1.0, stats_file=None,
+        polling=False)
+
+    wog = optparse.OptionGroup(parser, "Watch (daemon) Mode Options")
+    wog.add_option("", "--watch", metavar="DIR",
+        help="Watch DIR and convert files dropped into it until interrupted")
+    wog.add_option("", "--workers", type="int",
+        help="Number of worker threads in the watch mode [%default]")
+    wog.add_option("", "--interval", type="float",
+        help="Polling interval in seconds [%default]")
+    wog.add_option("", "--polling", action="store_true",
+        help="Poll the dir even if inotify is available")
+    wog.add_option("", "--stats-file",
+        help="Dump counters (processed, failed, backlog, throughput) in "
+            "JSON to this file periodically")
+
+    return wog
+
+
+def watch(options, handler, suffixes=(".xls", )):
+    """Run the watch mode with options parsed by the parser having the option
+    group from watch_options_group().
+    """
+    watcher = Watcher(options.watch, handler, suffixes, options.workers,
+        options.interval, options.stats_file, not options.polling)
+    watcher.run()
+
+# vim:sw=4:ts=4:et:
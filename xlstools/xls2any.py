@@ -1,53 +1,161 @@
 #
-# Generate a series of CSV/JSON files from an Excel (.xls) file.
+# Generate a series of CSV/JSON files from an Excel (.xls or .xlsx) file.
 #
 # Copyright (C) 2010, 2011 Red Hat, Inc.
 # Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
 #
 # License: MIT
 #
-import xlstools.csvx as XC
-import xlstools.xlsutils as XU
+import xlstools.utils as U
+import xlstools.watch as XW
 
+import codecs
 import logging
+import operator
 import optparse
 import os.path
 import os
+import re
 import sys
-import xlrd
 
 try:
     from collections import OrderedDict as dict
 except ImportError:
     pass
 
-try:
-    import json
-except ImportError:
-    try:
-        import simplejson as json
-    except ImportError:
-        logging.warn("JSON support will be disabled as json module not found.")
 
-        class json(object):
+# Row predicates (--where):
+WHERE_OPS = (
+    ("!=", operator.ne), (">=", operator.ge), ("<=", operator.le),
+    ("=", operator.eq), (">", operator.gt), ("<", operator.lt),
+)
+
+
+def parse_where(expr):
+    """Parse a predicate expression, 'COLUMN OP VALUE' or 'COLUMN' (the cell
+    in the column is not empty).
+
+    >>> parse_where("price>=10")
+    ('price', '>=', '10')
+    >>> parse_where("status = open")
+    ('status', '=', 'open')
+    >>> parse_where("comment")
+    ('comment', None, None)
+    """
+    for (op, _f) in WHERE_OPS:
+        if op in expr:
+            (column, literal) = expr.split(op, 1)
+            return (column.strip(), op, literal.strip())
+
+    return (expr.strip(), None, None)
+
+
+def coerce(literal, value):
+    """Convert the literal to the type of the cell value to compare with.
+
+    >>> coerce("10", 1.0)
+    10.0
+    >>> coerce("2012-01-02", (2012, 1, 1, 0, 0, 0))
+    (2012, 1, 2, 0, 0, 0)
+    >>> coerce("abc", u"")
+    u'abc'
+    """
+    if isinstance(value, float):
+        return float(literal)
+    elif isinstance(value, tuple):  # date
+        xs = [int(x) for x in re.split(r"[-/: T]+", literal) if x]
+        return tuple(xs + [0] * (6 - len(xs)))
+    else:
+        return unicode(literal)
+
+
+def make_predicate(op, literal):
+    """Returns the predicate function tests cell values.
+
+    >>> p = make_predicate(">=", "10")
+    >>> p(10.0), p(9.5), p(u"")
+    (True, False, False)
+    >>> p = make_predicate(None, None)
+    >>> p(u"a"), p(u"")
+    (True, False)
+    """
+    if op is None:
+        return lambda v: v != ""
+
+    f = dict(WHERE_OPS)[op]
+
+    def predicate(v):
+        if v == "" and literal != "":
+            return op == "!="
+        try:
+            return f(v, coerce(literal, v))
+        except ValueError:
+            return f(unicode(v), unicode(literal))
+
+    return predicate
+
+
+def column_index(headers, column):
+    """Returns the index of the column given as its header name or index.
+
+    >>> column_index(["a", "b", "c"], "c"), column_index(["a", "b", "c"], "1")
+    (2, 1)
+    """
+    if column in headers:
+        return headers.index(column)
+
+    try:
+        idx = int(column)
+    except ValueError:
+        idx = -1
 
-            @staticmethod
-            def load(*args, **kwargs):
-                raise RuntimeError("Not supported.")
+    if idx < 0 or idx >= len(headers):
+        raise ValueError("Column '%s' not found in headers: %s" % \
+            (column, ", ".join(headers)))
 
-            @staticmethod
-            def dump(*args, **kwargs):
-                raise RuntimeError("Not supported.")
+    return idx
 
 
 class DataDumper(object):
 
     suffix = ".dat"
+    mode = "w"
+
+    def __init__(self, worksheet, name=None, headers=[], outdir=os.curdir,
+            stream=None, columns=[], where=[], shard_rows=0, shard_bytes=0,
+            pipeline=False, profile=False):
+        """
+        :param stream: File object to write data into instead of the file in
+            outdir. It will not be closed after dump.
+        :param columns: Columns (header names or indices) to dump. All
+            columns by default.
+        :param where: Predicate expressions select rows to dump, see
+            parse_where().
+        :param shard_rows: Split output into shards have up to this number
+            of rows, see dump_shards().
+        :param shard_bytes: Split output into shards when the size reaches
+            this number of bytes.
+        :param pipeline: Write rows in another thread while reading and
+            converting rows, see xlstools.pipeline.
+        :param profile: Compute statistics of columns while dumping and write
+            them to NAME.profile.json in outdir, see xlstools.colprofile.
+            These are not written but kept in self.profile if stream is
+            given.
+        """
+        import xlstools.xlsutils as XU
 
-    def __init__(self, worksheet, name=None, headers=[], outdir=os.curdir):
         self.worksheet = worksheet
         self.name = name is None and self.worksheet.name or name
+        self.outdir = outdir
         self.output = os.path.join(outdir, self.name + self.suffix)
+        self.stream = stream
+        self.shard_rows = shard_rows
+        self.shard_bytes = shard_bytes
+        self.pipeline = pipeline
+        self.profile = None
+
+        if stream is not None and (shard_rows or shard_bytes):
+            raise ValueError("Output to a stream cannot be sharded")
 
         if headers:
             self.headers = [XU.normalize_key(h) for h in headers]
@@ -56,18 +164,145 @@ class DataDumper(object):
             self.headers = self.get_headers(self.worksheet)
             self.row_start = 1
 
+        self.where = []
+        for expr in where:
+            (column, op, literal) = parse_where(expr)
+            idx = column_index(self.headers, XU.normalize_key(column))
+            self.where.append((idx, make_predicate(op, literal)))
+
+        if columns:
+            self.columns = [
+                column_index(self.headers, XU.normalize_key(c)) for c in columns
+            ]
+            self.headers = [self.headers[i] for i in self.columns]
+        else:
+            self.columns = None
+
+        if profile:
+            import xlstools.colprofile as CP
+
+            self.profile = CP.Profiler(self.name, self.headers)
+
     def get_headers(self, worksheet):
+        import xlstools.xlsutils as XU
+
         return [XU.normalize_key(val) or "-" for idx, val in XU.sheet_cell_values_in_the_row_g(worksheet, 0)]
 
-    def open(self, flag="w"):
-        return open(self.output, flag)
+    def open(self, output=None):
+        if self.stream is not None:
+            return self.stream
+
+        return open(output or self.output, self.mode)
+
+    def close(self, out):
+        if out is not self.stream:
+            out.close()
 
     def foreach_sheet_cells_by_row(self):
-        return XU.foreach_sheet_cells_by_row(self.worksheet, self.row_start)
+        import xlstools.xlsutils as XU
 
-    def dump_impl(self):
+        return XU.foreach_sheet_cells_by_row(self.worksheet, self.row_start,
+            self.columns, self.where)
+
+    def begin(self, out):
+        """Start writing data into out, e.g. write headers.
+        """
+        pass
+
+    def write_row(self, rowdata):
         raise NotImplementedError("Children classes must implement this!")
 
+    def end(self):
+        """Finish writing data started by begin().
+        """
+        pass
+
+    def shard_path(self, idx):
+        return os.path.join(self.outdir, "%s.%05d%s" % (self.name, idx, self.suffix))
+
+    def dump_shards(self, rows):
+        """Dump rows into shards, NAME.00000.SUFFIX, NAME.00001.SUFFIX, ...
+        have headers and up to self.shard_rows rows or about self.shard_bytes
+        bytes each, and the manifest of these, NAME.manifest.json.
+        """
+        shards = []
+        (out, nrows) = (None, 0)
+
+        for rowdata in rows:
+            if out is None:
+                path = self.shard_path(len(shards))
+                out = self.open(path)
+                self.begin(out)
+
+            self.write_row(rowdata)
+            nrows += 1
+
+            if (self.shard_rows and nrows >= self.shard_rows) or \
+                    (self.shard_bytes and out.tell() >= self.shard_bytes):
+                self.end()
+                shards.append(dict(file=os.path.basename(path), rows=nrows,
+                    bytes=out.tell()))
+                self.close(out)
+                (out, nrows) = (None, 0)
+
+        if out is not None or not shards:
+            if out is None:  # No rows.
+                path = self.shard_path(0)
+                out = self.open(path)
+                self.begin(out)
+
+            self.end()
+            shards.append(dict(file=os.path.basename(path), rows=nrows,
+                bytes=out.tell()))
+            self.close(out)
+
+        # Remove stale shards of previous runs.
+        stale = re.compile(r"^%s\.(\d{5})%s$" % (re.escape(self.name),
+            re.escape(self.suffix)))
+        for f in os.listdir(self.outdir):
+            m = stale.match(f)
+            if m and int(m.group(1)) >= len(shards):
+                os.remove(os.path.join(self.outdir, f))
+
+        manifest = dict(
+            name=self.name, sheet=self.worksheet.name, headers=self.headers,
+            rows=sum(s["rows"] for s in shards), shards=shards,
+        )
+        mout = open(os.path.join(self.outdir, self.name + ".manifest.json"), "w")
+        U.json_module().dump(manifest, mout, indent=2)
+        mout.close()
+
+    def write_rows(self, rows):
+        if self.shard_rows or self.shard_bytes:
+            self.dump_shards(rows)
+            return
+
+        out = self.open()
+        self.begin(out)
+
+        for rowdata in rows:
+            self.write_row(rowdata)
+
+        self.end()
+        self.close(out)
+
+    def dump_impl(self):
+        rows = self.foreach_sheet_cells_by_row()
+
+        if self.profile is not None:
+            rows = self.profile.rows_g(rows)
+
+        if self.pipeline:
+            import xlstools.pipeline as XP
+
+            XP.pipe(rows, self.write_rows)
+        else:
+            self.write_rows(rows)
+
+        if self.profile is not None and self.stream is None:
+            self.profile.dump(os.path.join(self.outdir,
+                self.name + ".profile.json"))
+
     def dump(self):
         logging.info(" Try to dump data in sheet '%s' to '%s'" % (self.worksheet.name, self.output))
         self.dump_impl()
@@ -77,29 +312,37 @@ class DataDumper(object):
 class CsvDumper(DataDumper):
 
     suffix = ".csv"
+    mode = "wb"
 
-    def open(self):
-        return super(CsvDumper, self).open(flag="wb")
-
-    def dump_impl(self):
-        out = self.open()
-        writer = XC.UnicodeWriter(out)
-
-        writer.writerow(self.headers)
+    def begin(self, out):
+        import xlstools.csvx as XC
 
-        for rowdata in self.foreach_sheet_cells_by_row():
-            writer.writerow(rowdata)
+        self._writer = XC.UnicodeWriter(out)
+        self._writer.writerow(self.headers)
 
-        out.close()
+    def write_row(self, rowdata):
+        self._writer.writerow(rowdata)
 
 
 class JsonDumper(DataDumper):
 
     suffix = ".json"
 
-    def dump_impl(self):
-        data = [dict(zip(self.headers, rowdata)) for rowdata in self.foreach_sheet_cells_by_row()]
-        json.dump(data, self.open(), ensure_ascii=False, indent=2)
+    def begin(self, out):
+        self._json = U.json_module()
+        self._out = codecs.getwriter("utf-8")(out)
+        self._out.write("[")
+        self._sep = "\n"
+
+    def write_row(self, rowdata):
+        s = self._json.dumps(dict(zip(self.headers, rowdata)),
+            ensure_ascii=False, indent=2)
+
+        self._out.write(self._sep + "  " + s.replace("\n", "\n  "))
+        self._sep = ",\n"
+
+    def end(self):
+        self._out.write("\n]")
 
 
 DUMPERS = dict(
@@ -108,12 +351,9 @@ DUMPERS = dict(
 )
 
 
-def xls_to(xls_file, dumper, outdir, names=[], headers=[], dumper_map=DUMPERS):
-    book = xlrd.open_workbook(xls_file)
-
-    if not os.path.isdir(outdir):
-        os.makedirs(outdir)
-
+def sheets_and_names_g(book, names=[]):
+    """Yields each sheet in book and its name, given in names or sheet's.
+    """
     for n in range(0, book.nsheets):
         sheet = book.sheet_by_index(n)
 
@@ -122,16 +362,40 @@ def xls_to(xls_file, dumper, outdir, names=[], headers=[], dumper_map=DUMPERS):
         else:
             name = sheet.name
 
-        dmpr = dumper_map[dumper](sheet, name, headers, outdir)
+        yield (sheet, name)
+
+
+def xls_to(xls_file, dumper, outdir, names=[], headers=[], dumper_map=DUMPERS,
+        columns=[], where=[], shard_rows=0, shard_bytes=0, pipeline=False,
+        profile=False):
+    import xlstools.xlsutils as XU
+
+    book = XU.open_workbook(xls_file)
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    for (sheet, name) in sheets_and_names_g(book, names):
+        try:
+            dmpr = dumper_map[dumper](sheet, name, headers, outdir,
+                columns=columns, where=where, shard_rows=shard_rows,
+                shard_bytes=shard_bytes, pipeline=pipeline, profile=profile)
+        except ValueError, e:  # columns not found in the sheet.
+            logging.warn("Skipped sheet '%s': %s" % (sheet.name, e))
+            continue
+
         dmpr.dump()
 
 
 def opts_parser(dumper_map=DUMPERS):
-    p = optparse.OptionParser("""%prog [OPTION ...] XLS_FILE
+    p = optparse.OptionParser("""%prog [OPTION ...] XLS_FILE (.xls or .xlsx)
 
 Examples:
   %prog ABC.xls --outdir /tmp/outputs
   %prog ABC.xls --names=aaa,bbb,ccc
+  %prog ABC.xls --columns id,name,price --where 'price>=100' --where status
+  %prog ABC.xls --shard-rows 100000  # Sheet1.00000.csv, Sheet1.00001.csv, ...
+  %prog --watch /srv/dropbox --outdir /srv/outputs  # outputs/ABC/*.csv, ...
 """)
 
     dumper_choices = dumper_map.keys()
@@ -139,6 +403,12 @@ Examples:
     defaults = {
         "names": "",
         "headers": "",
+        "columns": "",
+        "where": [],
+        "shard_rows": 0,
+        "shard_bytes": 0,
+        "pipeline": False,
+        "profile": False,
         "dumper": "csv",
         "outdir": os.curdir,
         "verbose": False,
@@ -152,11 +422,29 @@ Examples:
     cog.add_option("", "--names", help="Comma separated filenames")
     cog.add_option("", "--headers",
         help="Comma separated list of headers [default: cell contents in 1st row of input .xls]")
+    cog.add_option("", "--columns",
+        help="Comma separated list of columns (header names or indices) to dump [default: all]")
+    cog.add_option("", "--where", action="append",
+        help="Dump only rows match the predicate, 'COLUMN OP VALUE' where OP "
+            "is one of =, !=, <, <=, >, >=, or 'COLUMN' (not empty). "
+            "Can be given multiple times to AND predicates")
+    cog.add_option("", "--shard-rows", type="int",
+        help="Split outputs into numbered shards have up to this number of "
+            "rows each, with headers and the manifest (NAME.manifest.json)")
+    cog.add_option("", "--shard-bytes", type="int",
+        help="Split outputs into numbered shards of about this size in bytes")
+    cog.add_option("", "--pipeline", action="store_true",
+        help="Write outputs in another thread while reading and converting "
+            "rows, effective if writes are slow, e.g. on network filesystems")
+    cog.add_option("", "--profile", action="store_true",
+        help="Write statistics of columns (nulls, min/max, distinct values "
+            "and types) computed while dumping to NAME.profile.json")
     cog.add_option("-o", "--outdir", help="Specify output dir [%default]")
     cog.add_option("-v", "--verbose", help="Verbose mode", action="store_true")
     cog.add_option("-q", "--quiet", help="Quiet mode", action="store_true")
     #cog.add_option('-T', '--test', help='Test mode - running test suites', default=False, action="store_true")
     p.add_option_group(cog)
+    p.add_option_group(XW.watch_options_group(p))
 
     return p
 
@@ -176,16 +464,32 @@ def main(dumper_map=DUMPERS):
 
     logging.basicConfig(level=loglevel)
 
+    names = options.names and options.names.split(',') or []
+    headers = options.headers and options.headers.split(',') or []
+    columns = options.columns and options.columns.split(',') or []
+
+    if options.watch:
+        def convert(xls_file):
+            name = os.path.splitext(os.path.basename(xls_file))[0]
+            outdir = os.path.join(options.outdir, name)
+            xls_to(xls_file, options.dumper, outdir, names, headers,
+                columns=columns, where=options.where,
+                shard_rows=options.shard_rows, shard_bytes=options.shard_bytes,
+                pipeline=options.pipeline, profile=options.profile)
+
+        XW.watch(options, convert, (".xls", ".xlsx"))
+        sys.exit(0)
+
     if len(args) < 1:
         parser.print_help()
         sys.exit(0)
 
-    names = options.names and options.names.split(',') or []
-    headers = options.headers and options.headers.split(',') or []
-
     xls_file = args[0]
 
-    xls_to(xls_file, options.dumper, options.outdir, names, headers)
+    xls_to(xls_file, options.dumper, options.outdir, names, headers,
+        columns=columns, where=options.where,
+        shard_rows=options.shard_rows, shard_bytes=options.shard_bytes,
+        pipeline=options.pipeline, profile=options.profile)
 
 
 if __name__ == '__main__':
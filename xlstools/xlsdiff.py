@@ -0,0 +1,345 @@
+#
+# Compare Excel (.xls) files and report added, removed and changed rows.
+#
+# Copyright (C) 2012 Satoru SATOH <satoru.satoh at gmail.com>
+# License: MIT
+#
+"""Rows of each worksheet in the old file are indexed in a hash table keyed
+by the value of the key column (or the whole row if no key column is given),
+and rows in the new file are looked up in it, so that files are compared in
+O(n) time.
+
+Output format (JSON):
+
+{
+  "SHEET_NAME": {
+    "added": [{"header_0": value_0, ...}, ...],
+    "removed": [{"header_0": value_0, ...}, ...],
+    "changed": [
+      {"key": key, "cells": [{"column": header, "old": old, "new": new}, ...]},
+      ...
+    ]
+  },
+  ...
+}
+
+Output format (CSV):
+
+sheet, change, key, column, old, new
+"""
+import xlstools.csvx as XC
+import xlstools.utils as U
+
+import logging
+import optparse
+import sys
+
+
+def headers_and_rows(sheet):
+    """Returns headers in the first row of the sheet and the iterator yields
+    rows after that.
+    """
+    import xlstools.xlsutils as XU
+
+    headers = [
+        XU.normalize_key(unicode(v)) or "-" for _i, v in
+            XU.sheet_cell_values_in_the_row_g(sheet, 0)
+    ]
+    return (headers, XU.foreach_sheet_cells_by_row(sheet, 1))
+
+
+def key_index(headers, key):
+    """Returns the index of the key column, given as its header name or index.
+
+    >>> key_index(["a", "b", "c"], "b"), key_index(["id", "b"], "ID")
+    (1, 0)
+    >>> key_index(["a", "b", "c"], "2")
+    2
+    >>> key_index(["a", "b", "c"], None)
+    >>> key_index(["a", "b", "c"], "7")
+    Traceback (most recent call last):
+    ...
+    ValueError: Key column '7' not found in headers: a, b, c
+    """
+    import xlstools.xlsutils as XU
+
+    if key is None:
+        return None
+
+    nkey = XU.normalize_key(key)
+    if nkey in headers:
+        return headers.index(nkey)
+
+    try:
+        idx = int(key)
+    except ValueError:
+        idx = -1
+
+    if idx < 0 or idx >= len(headers):
+        raise ValueError("Key column '%s' not found in headers: %s" % \
+            (key, ", ".join(headers)))
+
+    return idx
+
+
+def key_index_or_none(headers, key):
+    """key_index() for sheets only in either file; rows of these are not
+    compared by key, and the key is used only to identify rows in outputs.
+    """
+    try:
+        return key_index(headers, key)
+    except ValueError:
+        return None
+
+
+def hashable(row):
+    return tuple(isinstance(v, list) and tuple(v) or v for v in row)
+
+
+def diff_cells(headers, old, new):
+    """Returns the list of changed cells in the row.
+
+    >>> diff_cells(["a", "b", "c"], [1, 2, 3], [1, 5, 3])
+    [{'column': 'b', 'new': 5, 'old': 2}]
+    """
+    ret = []
+    for i in range(0, max(len(old), len(new))):
+        o = old[i] if len(old) > i else ""
+        n = new[i] if len(new) > i else ""
+
+        if o != n:
+            column = len(headers) > i and headers[i] or str(i)
+            ret.append(dict(column=column, old=o, new=n))
+
+    return ret
+
+
+def diff_rows(headers, old_rows, new_rows, key=None, row_start=2):
+    """Compare rows and returns the dict has lists of added, removed and
+    changed rows, and row numbers of added and removed rows (added_rows,
+    removed_rows).
+
+    :param headers: Column names
+    :param old_rows, new_rows: Iterables yield rows (lists of values)
+    :param key: Index of the key column or None to compare whole rows
+    :param row_start: Row number of the first row, next to headers
+
+    >>> r = diff_rows(["k", "v"], [[1, "a"], [2, "b"], [3, "c"]],
+    ...               [[1, "a"], [3, "C"], [4, "d"]], 0)
+    >>> r["added"], r["removed"], r["added_rows"], r["removed_rows"]
+    ([[4, 'd']], [[2, 'b']], [4], [3])
+    >>> r["changed"]
+    [{'cells': [{'column': 'v', 'new': 'C', 'old': 'c'}], 'key': 3}]
+    >>> r = diff_rows(["k", "v"], [[1, "a"], [1, "a"]], [[1, "a"], [2, "b"]])
+    >>> r["added"], r["removed"], r["changed"]
+    ([[2, 'b']], [[1, 'a']], [])
+    >>> r["added_rows"], r["removed_rows"]
+    ([3], [2])
+
+    Rows having duplicated keys are paired in order:
+
+    >>> r = diff_rows(["k", "v"], [[1, "a"], [1, "b"], [2, "c"]],
+    ...               [[1, "a"], [2, "c"]], 0)
+    >>> r["added"], r["removed"], r["changed"], r["removed_rows"]
+    ([], [[1, 'b']], [], [3])
+    >>> r = diff_rows(["k", "v"], [[1, "a"]], [[1, "a"], [1, "b"]], 0)
+    >>> r["added"], r["removed"], r["changed"], r["added_rows"]
+    ([[1, 'b']], [], [], [3])
+    """
+    index = dict()
+    (added, changed) = ([], [])
+
+    if key is None:
+        # Multi-set of whole rows: {row: [(row number, row), ...]}
+        for (n, row) in enumerate(old_rows, row_start):
+            index.setdefault(hashable(row), []).append((n, row))
+
+        for (n, row) in enumerate(new_rows, row_start):
+            rows = index.get(hashable(row))
+            if rows:
+                rows.pop()
+            else:
+                added.append((n, row))
+
+        removed = sorted(r for rows in index.values() for r in rows)
+    else:
+        # Rows having the same key are paired in order: {key: [(n, row)]}
+        for (n, row) in enumerate(old_rows, row_start):
+            k = hashable(row[key:key + 1])
+            if k in index:
+                logging.warn("Duplicated key found: %s" % row[key])
+            index.setdefault(k, []).append((n, row))
+
+        for (n, row) in enumerate(new_rows, row_start):
+            rows = index.get(hashable(row[key:key + 1]))
+            if not rows:
+                added.append((n, row))
+                continue
+
+            (_n, old) = rows.pop(0)
+            if old != row:
+                cells = diff_cells(headers, old, row)
+                if cells:  # Rows may differ only in trailing empty cells.
+                    changed.append(dict(key=row[key], cells=cells))
+
+        removed = sorted(r for rows in index.values() for r in rows)
+
+    return dict(added=[r for _n, r in added], removed=[r for _n, r in removed],
+        changed=changed, added_rows=[n for n, _r in added],
+        removed_rows=[n for n, _r in removed])
+
+
+def diff_books(old_book, new_book, key=None):
+    """Compare worksheets having the same name in the books.
+
+    :return: {sheet_name: {"added": [row], "removed": [row], "changed": ...}}
+    """
+    ret = dict()
+    old_sheets = old_book.sheet_names()
+
+    for sheet in new_book.sheets():
+        if sheet.name not in old_sheets:
+            logging.warn("Sheet '%s' was added" % sheet.name)
+            (headers, new_rows) = headers_and_rows(sheet)
+            (old_rows, kidx) = ([], key_index_or_none(headers, key))
+        else:
+            old_sheet = old_book.sheet_by_name(sheet.name)
+            (old_headers, old_rows) = headers_and_rows(old_sheet)
+            (headers, new_rows) = headers_and_rows(sheet)
+
+            if old_headers != headers:
+                logging.warn("Headers of sheet '%s' differ" % sheet.name)
+
+            kidx = key_index(headers, key)
+
+        d = diff_rows(headers, old_rows, new_rows, kidx)
+        d["headers"] = headers
+        d["key"] = kidx
+        ret[sheet.name] = d
+
+    for name in old_sheets:
+        if name not in ret:
+            logging.warn("Sheet '%s' was removed" % name)
+            (headers, old_rows) = headers_and_rows(old_book.sheet_by_name(name))
+            kidx = key_index_or_none(headers, key)
+            d = diff_rows(headers, old_rows, [], kidx)
+            d["headers"] = headers
+            d["key"] = kidx
+            ret[name] = d
+
+    return ret
+
+
+def differs(result):
+    return any(d[c] for d in result.values() for c in ("added", "removed", "changed"))
+
+
+def dump_json(result, out):
+    import codecs
+
+    data = dict()
+    for (name, d) in result.iteritems():
+        headers = d["headers"]
+        data[name] = dict(
+            added=[dict(zip(headers, r)) for r in d["added"]],
+            removed=[dict(zip(headers, r)) for r in d["removed"]],
+            changed=d["changed"],
+        )
+
+    U.json_module().dump(data, codecs.getwriter("utf-8")(out),
+        ensure_ascii=False, indent=2)
+
+
+def dump_csv(result, out):
+    """Cells of added and removed rows are written with the value of the key
+    column of the row, or the row number if the key is not given, as key.
+    """
+    writer = XC.UnicodeWriter(out)
+    writer.writerow(["sheet", "change", "key", "column", "old", "new"])
+
+    for (name, d) in result.iteritems():
+        (headers, kidx) = (d["headers"], d["key"])
+
+        for change in ("added", "removed"):
+            for (n, row) in zip(d[change + "_rows"], d[change]):
+                key = row[kidx] if kidx is not None else n
+                for (column, v) in zip(headers, row):
+                    if v != "":
+                        vs = change == "added" and ["", v] or [v, ""]
+                        writer.writerow([name, change, key, column] + vs)
+
+        for c in d["changed"]:
+            for cell in c["cells"]:
+                writer.writerow([name, "changed", c["key"], cell["column"],
+                    cell["old"], cell["new"]])
+
+
+DUMPERS = dict(
+    json=dump_json,  # default
+    csv=dump_csv,
+)
+
+
+def opts_parser():
+    p = optparse.OptionParser("""%prog [OPTION ...] OLD_XLS NEW_XLS
+
+Examples:
+  %prog yesterday.xls today.xls
+  %prog --key id --format csv -o diff.csv yesterday.xls today.xls
+
+Exit status is 0 if no differences found, 1 if found, or 2 on errors, e.g.
+the key column is not found.
+""")
+
+    p.set_defaults(key=None, format="json", output=None, verbose=False,
+        quiet=False)
+
+    p.add_option("-k", "--key",
+        help="Key column to identify rows, header name or column index. "
+            "Whole rows are compared if not given")
+    p.add_option("-f", "--format", type="choice", choices=DUMPERS.keys(),
+        help="Output format from " + ", ".join(DUMPERS.keys()) + " [%default]")
+    p.add_option("-o", "--output", help="Output file [stdout]")
+    p.add_option("-v", "--verbose", help="Verbose mode", action="store_true")
+    p.add_option("-q", "--quiet", help="Quiet mode", action="store_true")
+
+    return p
+
+
+def main():
+    loglevel = logging.WARN
+
+    p = opts_parser()
+    (options, args) = p.parse_args()
+
+    if options.verbose:
+        loglevel = logging.INFO
+
+    if options.quiet:
+        loglevel = logging.ERROR
+
+    logging.basicConfig(level=loglevel)
+
+    if len(args) < 2:
+        p.print_help()
+        sys.exit(0)
+
+    import xlstools.xlsutils as XU
+
+    (old_book, new_book) = [XU.open_workbook(f) for f in args[:2]]
+    try:
+        result = diff_books(old_book, new_book, options.key)
+    except ValueError, e:
+        print >> sys.stderr, e
+        sys.exit(2)  # Distinguished from 1, the files differ.
+
+    out = options.output and open(options.output, "wb") or sys.stdout
+    DUMPERS[options.format](result, out)
+
+    sys.exit(differs(result) and 1 or 0)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim:sw=4:ts=4:et:
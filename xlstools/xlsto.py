@@ -6,19 +6,14 @@
 #
 import xlstools.csvx as XC
 import xlstools.utils as U
+import xlstools.watch as XW
 
 import copy
+import datetime
 import logging
 import optparse
 import os
-import sqlite3
 import sys
-import xlrd
-
-try:
-    import json
-except ImportError:
-    import simplejson as json
 
 
 """xlsto.py
@@ -48,9 +43,16 @@ data spec format is JSON. Here is an example.
                                                         # 
         "marker_idx": 0,   # The index of the col to check whether data exists in row or not.
                            # If omitted, 0 will be used.
-        "data_range": [[4,-1],[0,12]]  # data range [[row_bein, row_end], [col_bein, col_end]].
-                                       # Indices start with 0 and -1 indicates infinite, 
-                                       # that is, will be detected automatically.
+        "data_range": [[4,-1],[0,12]],  # data range [[row_bein, row_end], [col_bein, col_end]].
+                                        # Indices start with 0 and -1 indicates infinite, 
+                                        # that is, will be detected automatically.
+        "types": {"test_key0": "TEXT"},  # optional. Override column types inferred from
+                                         # cells; INTEGER, REAL, TEXT, DATE or TIMESTAMP.
+        "indexes": ["test_key0", ["key_a", "key_b"]],  # optional. Columns to create indexes on.
+        "fulltext": ["description"]  # optional. Text columns to build the full-text search
+                                     # (FTS5) index, <table_name>_fts, on in sqlite db, or
+                                     # {"columns": [...], "tokenize": "trigram"} to specify
+                                     # the tokenizer, e.g. trigram for Japanese text.
       },
       ...
     ]
@@ -60,43 +62,309 @@ data spec format is JSON. Here is an example.
 """
 
 
+_SPECS = dict()  # Cache of loaded specs: {specfile: (mtime, specs)}
+
+
 def load_specs(specfile):
     """Loads given data spec and returns it as an internal representation.
     See the spec example above also.
+
+    Loaded specs are cached and reused until the spec file is modified.
+    """
+    mtime = os.stat(specfile).st_mtime
+
+    cached = _SPECS.get(specfile)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    specs = U.json_module().load(open(specfile, 'r'))
+    _SPECS[specfile] = (mtime, specs)
+
+    return specs
+
+
+def marked(value):
+    """Returns True if the value of the marker cell is not empty. Rows of which
+    the marker cell is empty are skipped.
+
+    >>> marked(u"a"), marked(0.0), marked(u"")
+    (True, False, False)
+    """
+    return bool(value)
+
+
+def sheet_data_range(sheet, sheetspec):
+    """Returns (rows, cols, marker_idx, keynames) of the data range in the
+    sheet from the sheet spec; rows is [start, end) of rows or [start, None]
+    to read until the end of the sheet, and cols is [start, end] of columns.
+
+    >>> spec = dict(keys=["Key A", "B"], data_range=[[1, -1], [0, 1]])
+    >>> sheet_data_range(None, spec)
+    ([1, None], [0, 1], 0, ['key_a', 'b'])
+    """
+    midx = sheetspec.get('marker_idx', 0)
+    rows,cols = [list(r) for r in sheetspec['data_range']]
+    if rows[1] == -1:
+        rows[1] = None  # Read until the end of the sheet.
+
+    # TODO: exceptions handling. (IndexError, etc.)
+    keys = [(isinstance(c, list) and sheet.cell_value(*c) or c) for c in sheetspec['keys']]
+
+    return (rows, cols, midx, [U.normalize_key(k) for k in keys])
+
+
+class DataRange(object):
+    """Rows (lists of cells) in the data range of the sheet. Rows are read
+    each time iterated, in streaming for .xlsx files, and rows of which the
+    marker cell is empty are skipped.
     """
-    return json.load(open(specfile, 'r'))
+
+    def __init__(self, sheet, rows, cols, marker_idx=0):
+        self.sheet = sheet
+        self.rows = rows
+        self.cols = cols
+        self.marker_idx = marker_idx
+
+    def __iter__(self):
+        import xlstools.xlsutils as XU
+
+        (start, end) = (self.cols[0], self.cols[1] + 1)
+
+        for (_rx, cells) in XU.sheet_rows_g(self.sheet, *self.rows):
+            if len(cells) > self.marker_idx and marked(cells[self.marker_idx].value):
+                yield cells[start:end]
 
 
 def load_datasets(specfile, filepath):
     """Loads datasets from Excel workbooks (files) according to each file spec
     in specfile and returns these as dict objects.
     """
+    import xlstools.xlsutils as XU
+
     for filespec in load_specs(specfile):
-        book = xlrd.open_workbook(filepath)  # might throw IndexError, IOError, etc.
+        book = XU.open_workbook(filepath)  # might throw IndexError, IOError, etc.
 
         for sheet_idx in range(0, len(filespec['sheets'])):
             sheet = book.sheet_by_index(sheet_idx)
             sheetspec = filespec['sheets'][sheet_idx]
             dataset = copy.copy(sheetspec)
 
-            midx = filespec['sheets'][sheet_idx].get('marker_idx', 0)
-            rows,cols = sheetspec['data_range']
-            if rows[1] == -1:
-                rows[1] = sheet.nrows
-
-            # TODO: exceptions handling. (IndexError, etc.)
-            keys = [(isinstance(c, list) and sheet.cell_value(*c) or c) for c in sheetspec['keys']]
-            values = [sheet.row(rx)[cols[0]:cols[1]+1] for rx in range(*rows) if sheet.row(rx)[midx].value]
+            (rows, cols, midx, keynames) = sheet_data_range(sheet, sheetspec)
 
-            dataset['keynames'] = [U.normalize_key(k) for k in keys]
-            dataset['values'] = values
+            dataset['keynames'] = keynames
+            dataset['values'] = DataRange(sheet, rows, cols, midx)
+            dataset['datemode'] = book.datemode
+            dataset['column_types'] = column_types(dataset)
 
             yield dataset
 
 
+# Schema related:
+def cell_type(cell, datemode=0):
+    """Returns the SQL type of given cell's value or None if the cell is empty.
+
+    Times without dates are TEXT as these are stored as ISO 8601 strings (see
+    typed_value()), and date cells xlrd cannot convert, e.g. ambiguous dates
+    before 1900-03-01, are numbers.
+    """
+    import xlrd
+
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK) or cell.value == "":
+        return None
+    elif cell.ctype == xlrd.XL_CELL_NUMBER:
+        return float(cell.value).is_integer() and 'INTEGER' or 'REAL'
+    elif cell.ctype == xlrd.XL_CELL_DATE:
+        tpl = date_tuple(cell.value, datemode)
+        if tpl is None:
+            return float(cell.value).is_integer() and 'INTEGER' or 'REAL'
+        elif tpl[:3] == (0, 0, 0):
+            return 'TEXT'
+
+        return float(cell.value).is_integer() and 'DATE' or 'TIMESTAMP'
+    elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return 'INTEGER'
+    else:
+        return 'TEXT'
+
+
+def date_tuple(value, datemode):
+    """Returns the date tuple of the date value, or None if xlrd cannot
+    convert it.
+    """
+    import xlrd
+
+    try:
+        return xlrd.xldate_as_tuple(value, datemode)
+    except xlrd.XLDateError:
+        return None
+
+
+def column_types(dataset):
+    """Infer the SQL type of each column from the types of cells across the
+    data range. Types given in the spec ('types') take precedence.
+
+    >>> column_types(dict(keynames=['a'], values=[], types=dict(a='real')))
+    ['REAL']
+    >>> column_types(dict(keynames=['a'], values=[], types=dict(a='TXT')))
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown type of column 'a': TXT
+    """
+    keynames = dataset['keynames']
+    datemode = dataset.get('datemode', 0)
+    types = [None] * len(keynames)
+
+    for xs in dataset['values']:
+        for i, x in enumerate(xs[:len(types)]):
+            if types[i] != 'TEXT':
+                types[i] = U.unify_types(types[i], cell_type(x, datemode))
+
+    overrides = dataset.get('types', {})
+    if isinstance(overrides, dict):
+        overrides = dict((U.normalize_key(k), t.upper()) for k, t in overrides.iteritems())
+    else:
+        overrides = {}
+
+    for (k, t) in overrides.iteritems():
+        if t not in U.SQL_TYPES:
+            raise ValueError("Unknown type of column '%s': %s" % (k, t))
+
+    return [overrides.get(k, t or 'TEXT') for k, t in zip(keynames, types)]
+
+
+def typed_value(cell, sqltype, datemode):
+    """Convert a cell to the native value of given SQL type; empty cells and
+    cells cannot be converted to the type, e.g. 'abc' or 1.5 for INTEGER, are
+    converted to None (NULL).
+
+    Times are converted to ISO 8601 strings as neither sqlite3 nor Arrow's
+    timestamp can hold datetime.time, and raw values are kept for date cells
+    xlrd cannot convert.
+
+    >>> import xlrd
+    >>> time = xlrd.sheet.Cell(xlrd.XL_CELL_DATE, 0.5)
+    >>> cell_type(time), typed_value(time, 'TEXT', 0)
+    ('TEXT', '12:00:00')
+    >>> ambiguous = xlrd.sheet.Cell(xlrd.XL_CELL_DATE, 12.0)
+    >>> cell_type(ambiguous), typed_value(ambiguous, 'INTEGER', 0)
+    ('INTEGER', 12)
+    >>> cell_type(ambiguous, 1), typed_value(ambiguous, 'DATE', 1)
+    ('DATE', datetime.date(1904, 1, 13))
+
+    Values are converted to the types overridden in the spec:
+
+    >>> cells = [xlrd.sheet.Cell(xlrd.XL_CELL_NUMBER, 1.5),
+    ...          xlrd.sheet.Cell(xlrd.XL_CELL_TEXT, u" 12 "),
+    ...          xlrd.sheet.Cell(xlrd.XL_CELL_TEXT, u"abc")]
+    >>> [typed_value(c, 'INTEGER', 0) for c in cells]
+    [None, 12, None]
+    >>> [typed_value(c, 'REAL', 0) for c in cells]
+    [1.5, 12.0, None]
+    >>> [typed_value(c, 'TEXT', 0) for c in cells]
+    [u'1.5', u' 12 ', u'abc']
+    >>> [typed_value(c, 'DATE', 0) for c in cells]
+    [None, None, None]
+    >>> typed_value(xlrd.sheet.Cell(xlrd.XL_CELL_NUMBER, 40909.5), 'DATE', 0)
+    datetime.date(2012, 1, 1)
+    """
+    import xlrd
+
+    ctype = cell_type(cell, datemode)
+    if ctype is None:
+        return None
+
+    value = cell.value
+    tpl = None
+
+    if cell.ctype == xlrd.XL_CELL_DATE or \
+            (cell.ctype == xlrd.XL_CELL_NUMBER and sqltype in ('DATE', 'TIMESTAMP')):
+        tpl = date_tuple(value, datemode)
+        if tpl is not None and tpl[:3] == (0, 0, 0):  # Time without date.
+            if cell.ctype == xlrd.XL_CELL_DATE:
+                value = datetime.time(*tpl[3:]).isoformat()
+            tpl = None
+
+    if sqltype == 'TEXT':
+        if cell.ctype == xlrd.XL_CELL_DATE and tpl is not None:
+            if ctype == 'DATE':
+                return datetime.date(*tpl[:3]).isoformat()
+            return datetime.datetime(*tpl).isoformat()
+        elif ctype == 'INTEGER' and cell.ctype == xlrd.XL_CELL_NUMBER:
+            return unicode(int(value))
+        elif not isinstance(value, basestring):
+            return unicode(value)
+        return value
+
+    elif sqltype in ('DATE', 'TIMESTAMP'):
+        if tpl is None:
+            return None
+        elif sqltype == 'DATE':
+            return datetime.date(*tpl[:3])
+        return datetime.datetime(*tpl)
+
+    # INTEGER or REAL:
+    if cell.ctype in (xlrd.XL_CELL_NUMBER, xlrd.XL_CELL_DATE, xlrd.XL_CELL_BOOLEAN):
+        value = float(cell.value)
+    elif cell.ctype == xlrd.XL_CELL_TEXT:
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    else:  # Errors.
+        return None
+
+    if sqltype == 'REAL':
+        return value
+
+    return int(value) if value.is_integer() else None
+
+
+def typed_rows(dataset):
+    """Yields rows of native values converted according to column types.
+    """
+    types = dataset['column_types']
+    datemode = dataset['datemode']
+
+    for xs in dataset['values']:
+        yield [typed_value(x, t, datemode) for x, t in zip(xs, types)]
+
+
+def index_columns(dataset):
+    """Returns the list of column lists to create indexes on from the spec.
+    """
+    return [
+        [U.normalize_key(c) for c in (isinstance(i, list) and i or [i])]
+            for i in dataset.get('indexes', [])
+    ]
+
+
+def fulltext_spec(dataset):
+    """Returns (columns, tokenizer) of the full-text search index from the
+    spec, or None if not given.
+
+    >>> fulltext_spec({'fulltext': ['Description', 'comment']})
+    (['description', 'comment'], None)
+    >>> fulltext_spec({'fulltext': {'columns': ['note'], 'tokenize': 'trigram'}})
+    (['note'], 'trigram')
+    >>> fulltext_spec({})
+    """
+    spec = dataset.get('fulltext')
+    if not spec:
+        return None
+
+    if not isinstance(spec, dict):
+        spec = dict(columns=spec)
+
+    columns = [U.normalize_key(c) for c in spec.get('columns', [])]
+    return (columns, spec.get('tokenize'))
+
+
 # CSV related:
-def csv_process_dataset(outdir, dataset, force):
+def csv_process_dataset(outdir, dataset, force, pipeline=False):
     """Create db tables and insert datasets into it.
+
+    :param pipeline: Write rows in another thread while reading rows, see
+        xlstools.pipeline.
     """
     outfile = dataset['table_name']
     keynames = dataset['keynames']
@@ -107,39 +375,120 @@ def csv_process_dataset(outdir, dataset, force):
     if force:
         U.rename_if_exists(outfile)
 
-    writer = XC.UnicodeWriter(open(outfile, 'wb'))
+    out = open(outfile, 'wb')
+    writer = XC.UnicodeWriter(out)
     writer.writerow(keynames)
 
-    for xs in values:
-        writer.writerow([(x.value and x.value or "") for x in xs])
+    rows = ([(x.value and x.value or "") for x in xs] for xs in values)
 
+    if pipeline:
+        import xlstools.pipeline as XP
 
-def csv_create(specfile, filepath, outdir, force):
+        XP.pipe(rows, writer.writerows)
+    else:
+        writer.writerows(rows)
+
+    out.close()
+
+
+def csv_create(specfile, filepath, outdir, force, pipeline=False):
     """Create the database (create tables and insert datasets into it).
     """
     if not os.path.exists(outdir):
         os.mkdir(outdir, 0755)
 
     for dataset in load_datasets(specfile, filepath):
-        csv_process_dataset(outdir, dataset, force)
+        csv_process_dataset(outdir, dataset, force, pipeline)
 
 
 # SQLite DB related:
-def db_process_dataset(dbfile, dataset):
-    """Create db tables and insert datasets into it.
+def db_connect(dbfile):
+    import sqlite3
+
+    return sqlite3.connect(dbfile, check_same_thread=False)
+
+
+def db_check_fts5(conn, tokenize=None):
+    """Raises RuntimeError if FTS5 or the tokenizer is not available in the
+    SQLite library.
+    """
+    import sqlite3
+
+    sql = "create virtual table temp.xlsto_fts5_check using fts5(x%s)" % \
+        (tokenize and ", tokenize=%s" % db_quote(tokenize) or "")
+    try:
+        conn.execute(sql)
+    except sqlite3.OperationalError, e:
+        raise RuntimeError("Full-text search (FTS5%s) is not available in "
+            "SQLite %s: %s" % (tokenize and " with " + tokenize or "",
+                sqlite3.sqlite_version, e))
+
+    conn.execute("drop table temp.xlsto_fts5_check")
+
+
+def db_quote(s):
+    """
+    >>> db_quote("unicode61 remove_diacritics 2"), db_quote("it's")
+    ("'unicode61 remove_diacritics 2'", "'it''s'")
     """
-    conn = sqlite3.connect(dbfile)
+    return "'%s'" % s.replace("'", "''")
 
+
+def db_create_fulltext_index(conn, table, columns, tokenize=None):
+    """Create the full-text search index, an external content FTS5 table
+    named <table>_fts refers rows in table, and build it in bulk.
+
+    The index is not updated automatically when rows in table are changed
+    later. Search rows like:
+
+      select * from <table> where rowid in
+        (select rowid from <table>_fts where <table>_fts match 'query')
+    """
+    fts = table + "_fts"
+    options = ["content=%s" % db_quote(table), "content_rowid='rowid'"]
+    if tokenize:
+        options.append("tokenize=%s" % db_quote(tokenize))
+
+    sql = "create virtual table %s using fts5(%s)" % \
+        (fts, ', '.join(columns + options))
+    logging.info("sql = '%s'" % sql)
+    conn.execute(sql)
+
+    conn.execute("insert into %s(%s) values('rebuild')" % (fts, fts))
+    conn.commit()
+
+
+def db_process_dataset(conn, dataset, replace=False):
+    """Create db tables and insert datasets into it.
+
+    :param conn: Connection to the database
+    :param dataset: Dataset loaded by load_datasets()
+    :param replace: Drop the table before creating it if exists
+    """
     table = dataset['table_name']
     keynames = dataset['keynames']
-    values = dataset['values']
+    types = dataset['column_types']
 
-    keys = ', '.join(keynames).replace('?','')
+    names = [k.replace('?','') for k in keynames]
+    keys = ', '.join(names)
     placeholders = ', '.join('?' * len(keynames))
 
+    fulltext = fulltext_spec(dataset)
+    if fulltext:
+        missing = [c for c in fulltext[0] if c not in names]
+        if missing:
+            raise ValueError("Full-text search columns not found in %s: %s" % \
+                (table, ', '.join(missing)))
+        db_check_fts5(conn, fulltext[1])
+
     # 1. create table:
+    if replace:
+        conn.execute("drop table if exists %s_fts" % table)
+        conn.execute("drop table if exists %s" % table)
+
     #sql = "create table %s (%s) if not exists" % (table, keys)
-    sql = "create table %s (%s)" % (table, keys)
+    columns = ', '.join("%s %s" % kt for kt in zip(names, types))
+    sql = "create table %s (%s)" % (table, columns)
     logging.info("sql = '%s'" % sql)
     conn.execute(sql)
     conn.commit()
@@ -148,37 +497,224 @@ def db_process_dataset(dbfile, dataset):
     sql = "insert or replace into %s (%s) values (%s)" % (table, keys, placeholders)
     logging.info("sql = '%s'" % sql)
 
-    for xs in values:
-        vs = [(x.value and x.value or "") for x in xs]
-        if vs:
-            logging.info("value = '%s'" % vs)
-            conn.execute(sql, vs)
+    conn.executemany(sql, typed_rows(dataset))
+    conn.commit()
+
+    # 3. create indexes:
+    for cs in index_columns(dataset):
+        sql = "create index %s_%s_idx on %s (%s)" % \
+            (table, '_'.join(cs), table, ', '.join(cs))
+        logging.info("sql = '%s'" % sql)
+        conn.execute(sql)
     conn.commit()
 
-    conn.close()
+    # 4. build the full-text search index:
+    if fulltext:
+        db_create_fulltext_index(conn, table, fulltext[0], fulltext[1])
 
 
-def db_create(specfile, filepath, dbfile, force):
+def db_create(specfile, filepath, dbfile, force, conn=None):
     """Create the database (create tables and insert datasets into it).
+
+    If conn, an open connection to dbfile, is given, it is used and kept open
+    and tables already exist in the database are replaced.
     """
     logging.info("creating db '%s'" % dbfile)
-    if force:
-        U.rename_if_exists(dbfile)
+    if conn is None:
+        if force:
+            U.rename_if_exists(dbfile)
+        c = db_connect(dbfile)
+    else:
+        c = conn
+
+    for dataset in load_datasets(specfile, filepath):
+        db_process_dataset(c, dataset, conn is not None)
+
+    if conn is None:
+        c.close()
+
+
+# DuckDB related:
+DUCKDB_TYPES = dict(
+    INTEGER='BIGINT', REAL='DOUBLE', TEXT='VARCHAR', DATE='DATE',
+    TIMESTAMP='TIMESTAMP',
+)
+
+
+DUCKDB_BATCH_ROWS = 100000  # Number of rows loaded at once.
+
+
+def duckdb_connect(dbfile):
+    # Rows are loaded through Arrow, as DuckDB's executemany() inserts rows
+    # one by one and is too slow for bulk loads.
+    try:
+        import duckdb
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("DuckDB output is not supported as duckdb or pyarrow module not found.")
+
+    return duckdb.connect(dbfile)
+
+
+def column_batches_g(rows, ncols, size=DUCKDB_BATCH_ROWS):
+    """Yields lists of columns (lists of values) of up to size rows each.
+    Short rows are padded with None and long rows are truncated.
+
+    >>> list(column_batches_g([[1, 'a'], [2], [3, 'c', 'x']], 2, 2))
+    [[[1, 2], ['a', None]], [[3], ['c']]]
+    """
+    columns = [[] for _i in range(ncols)]
+
+    for (n, row) in enumerate(rows):
+        for (i, column) in enumerate(columns):
+            column.append(row[i] if i < len(row) else None)
+
+        if (n + 1) % size == 0:
+            yield columns
+            columns = [[] for _i in range(ncols)]
+
+    if columns and columns[0]:
+        yield columns
+
+
+def duckdb_process_dataset(conn, dataset, replace=False):
+    """Create a table in the DuckDB database and load the dataset into it in
+    bulk through Arrow ingestion. Rows are read in streaming and loaded in
+    batches of DUCKDB_BATCH_ROWS rows to bound memory usage.
+    """
+    import pyarrow
+
+    table = dataset['table_name']
+    keynames = dataset['keynames']
+    types = [DUCKDB_TYPES.get(t, t) for t in dataset['column_types']]
+
+    names = [k.replace('?','') for k in keynames]
+
+    # 1. create table:
+    if replace:
+        conn.execute("drop table if exists %s" % table)
+
+    sql = "create table %s (%s)" % \
+        (table, ', '.join("%s %s" % kt for kt in zip(names, types)))
+    logging.info("sql = '%s'" % sql)
+    conn.execute(sql)
+
+    # 2. load dataset into the table:
+    atypes = dict(
+        BIGINT=pyarrow.int64(), DOUBLE=pyarrow.float64(),
+        VARCHAR=pyarrow.string(), DATE=pyarrow.date32(),
+        TIMESTAMP=pyarrow.timestamp('us'),
+    )
+    sql = "insert into %s select * from xlsto_src" % table
+    logging.info("sql = '%s'" % sql)
+
+    for columns in column_batches_g(typed_rows(dataset), len(names),
+            DUCKDB_BATCH_ROWS):
+        arrays = [
+            pyarrow.array(c, type=atypes.get(t)) for c, t in zip(columns, types)
+        ]
+        src = pyarrow.Table.from_arrays(arrays, names=names)
+
+        conn.register("xlsto_src", src)
+        conn.execute(sql)
+        conn.unregister("xlsto_src")
+
+    # 3. create indexes:
+    for cs in index_columns(dataset):
+        sql = "create index %s_%s_idx on %s (%s)" % \
+            (table, '_'.join(cs), table, ', '.join(cs))
+        logging.info("sql = '%s'" % sql)
+        conn.execute(sql)
+
+
+def duckdb_create(specfile, filepath, dbfile, force, conn=None):
+    """Create the DuckDB database (create tables and load datasets into it).
+
+    If conn is given, it is used and kept open as db_create() does.
+    """
+    logging.info("creating duckdb '%s'" % dbfile)
+    if conn is None:
+        if force:
+            U.rename_if_exists(dbfile)
+        c = duckdb_connect(dbfile)
+    else:
+        c = conn
+
     for dataset in load_datasets(specfile, filepath):
-        db_process_dataset(dbfile, dataset)
+        duckdb_process_dataset(c, dataset, conn is not None)
+
+    if conn is None:
+        c.close()
+
+
+OUTPUT_TYPES = dict(
+    sqlite=(db_create, '.db'),  # default
+    csv=(csv_create, ''),
+    duckdb=(duckdb_create, '.duckdb'),
+)
+
+CONNECTORS = dict(
+    sqlite=db_connect,
+    duckdb=duckdb_connect,
+)
+
+
+def spec_path(filepath):
+    """Returns the path of the spec file guessed from the input file.
+
+    >>> spec_path('/a/b/c.xls')
+    '/a/b/c.spec'
+    """
+    return filepath[:filepath.rfind('.')] + '.spec'
+
+
+class Converter(object):
+    """Converts input files in the watch mode. Each input file is converted to
+    the output (db file or dir for csv) named after it in outdir. Connections
+    to the output databases are closed after each conversion not to keep one
+    open per input file in the long-running process.
+    """
+
+    def __init__(self, outdir, output_type, specfile=None, pipeline=False):
+        self.outdir = outdir
+        self.output_type = output_type
+        self.specfile = specfile
+        self.pipeline = pipeline
+
+    def __call__(self, filepath):
+        (create_f, suffix) = OUTPUT_TYPES[self.output_type]
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        out = os.path.join(self.outdir, name + suffix)
+        specfile = self.specfile or spec_path(filepath)
+
+        if self.output_type in CONNECTORS:
+            # Tables already exist in the output are replaced.
+            conn = CONNECTORS[self.output_type](out)
+            try:
+                create_f(specfile, filepath, out, False, conn)
+            finally:
+                conn.close()
+        elif self.pipeline:
+            create_f(specfile, filepath, out, False, self.pipeline)
+        else:
+            create_f(specfile, filepath, out, False)
 
 
 def opts_parser():
-    parser = optparse.OptionParser('%prog [OPTION ...] INPUT_FILE')
+    parser = optparse.OptionParser('%prog [OPTION ...] INPUT_FILE\n       %prog [OPTION ...] --watch DIR')
     parser.add_option('-s', '--spec', help='specify "spec" file defines XLS data structure [guessed from input file]')
     parser.add_option('-o', '--output', dest='output', default='output',
-        help='specify database file for "sqlite" output or dir for "csv" output. [default: output.db or output/]')
-    parser.add_option('-t', '--output-type', dest='type',
-        help='Specify the output type, csv or sqlite [default].')
+        help='specify database file for "sqlite" and "duckdb" output or dir for "csv" output, or dir for outputs in the watch mode. [default: output.db, output.duckdb or output/]')
+    parser.add_option('-t', '--output-type', dest='type', default='sqlite',
+        type='choice', choices=OUTPUT_TYPES.keys(),
+        help='Specify the output type, csv, duckdb or sqlite [default].')
     parser.add_option('-f', '--force', dest='force', action='store_true',
         help='Force overwrite existing file/dir.', default=False)
+    parser.add_option('', '--pipeline', action='store_true', default=False,
+        help='Write rows in another thread while reading rows ("csv" output only).')
     parser.add_option('-v', '--verbose', dest='verbose', action='store_true',
         help='Verbose mode.', default=False)
+    parser.add_option_group(XW.watch_options_group(parser))
     return parser
 
 
@@ -191,12 +727,17 @@ def main():
 
     out = options.output
 
-    if options.type == 'csv':
-        create_f = csv_create
-    else:
-        create_f = db_create
-        if not out.endswith('.db'):
-            out = out + '.db'
+    if options.watch:
+        if not os.path.exists(out):
+            os.makedirs(out)
+
+        converter = Converter(out, options.type, options.spec, options.pipeline)
+        XW.watch(options, converter, (".xls", ".xlsx"))
+        sys.exit(0)
+
+    (create_f, suffix) = OUTPUT_TYPES[options.type]
+    if not out.endswith(suffix):
+        out = out + suffix
 
     if len(args) < 1:
         parser.print_help()
@@ -207,7 +748,7 @@ def main():
     if options.spec:
         specfile = options.spec
     else:
-        specfile = filepath[:filepath.rfind('.')] + '.spec'
+        specfile = spec_path(filepath)
 
     if not os.path.exists(specfile):
         print >> sys.stderr, "Spec file '%s' does not exists!" % specfile
@@ -217,7 +758,10 @@ def main():
         print >> sys.stderr, "Input file '%s' does not exists!" % filepath
         sys.exit(-1)
 
-    create_f(specfile, filepath, out, options.force)
+    if options.pipeline and options.type == 'csv':
+        create_f(specfile, filepath, out, options.force, options.pipeline)
+    else:
+        create_f(specfile, filepath, out, options.force)
 
 
 if __name__ == '__main__':
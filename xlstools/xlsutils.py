@@ -8,6 +8,16 @@ from itertools import groupby
 
 import sys
 import xlrd
+import xlstools.xlsxreader as XR
+
+
+def open_workbook(filename=None, file_contents=None):
+    """Open .xls file with xlrd or .xlsx file with the streaming reader.
+    """
+    if XR.is_xlsx(filename, file_contents):
+        return XR.open_workbook(filename, file_contents)
+
+    return xlrd.open_workbook(filename, file_contents=file_contents)
 
 
 def show(cell_type, cell_value, datemode):
@@ -30,19 +40,27 @@ def show(cell_type, cell_value, datemode):
     return v
 
 
-def sheet_cell_values_in_the_row_g(sheet, row, datemode=None):
+def cell_value(sheet, row, col, datemode):
+    ctype = sheet.cell_type(row, col)
+
+    if ctype == xlrd.XL_CELL_EMPTY:
+        return ""
+
+    return show(ctype, sheet.cell_value(row, col), datemode)
+
+
+def sheet_cell_values_in_the_row_g(sheet, row, datemode=None, columns=None):
+    """
+    :param columns: Indices of columns to get values of. All columns by default.
+    """
     if datemode is None:
         datemode = sheet.book.datemode
 
-    for y in xrange(0, sheet.ncols):
-        ctype = sheet.cell_type(row, y)
+    if columns is None:
+        columns = xrange(0, sheet.ncols)
 
-        if ctype == xlrd.XL_CELL_EMPTY:
-            v = ""
-        else:
-            v = show(ctype, sheet.cell_value(row, y), datemode)
-
-        yield (y, v)  # row idx, col idx and its value
+    for y in columns:
+        yield (y, cell_value(sheet, row, y, datemode))  # col idx and its value
 
 
 def sheet_cell_values_g(sheet, row_start):
@@ -57,9 +75,224 @@ def fst(tpl_or_list):
     return tpl_or_list[0]
 
 
-def foreach_sheet_cells_by_row(sheet, row_start=1):
-    for k, g in groupby(sheet_cell_values_g(sheet, row_start), fst):
-        yield [t[2] for t in g]
+def foreach_sheet_cells_by_row(sheet, row_start=1, columns=None, where=[]):
+    """Yields values of cells in each row.
+
+    :param columns: Indices of columns to get values of. All columns by default.
+    :param where: List of (column index, predicate) to select rows. Predicate
+        is a function takes the cell value and returns bool.
+
+    Only cells in the columns, and the columns in where before that, are read
+    and converted.
+    """
+    if hasattr(sheet, "rows_g"):  # Sheets of .xlsx files read in streaming.
+        for row in sheet_rows_by_stream_g(sheet, row_start, columns, where):
+            yield row
+        return
+
+    if columns is None and not where:
+        for k, g in groupby(sheet_cell_values_g(sheet, row_start), fst):
+            yield [t[2] for t in g]
+        return
+
+    datemode = sheet.book.datemode
+
+    for x in xrange(row_start, sheet.nrows):
+        if where and not all(p(cell_value(sheet, x, y, datemode)) for y, p in where):
+            continue
+
+        yield [v for _y, v in sheet_cell_values_in_the_row_g(sheet, x, datemode, columns)]
+
+
+def sheet_rows_by_stream_g(sheet, row_start=1, columns=None, where=[]):
+    """foreach_sheet_cells_by_row() for sheets read in streaming.
+    """
+    datemode = sheet.book.datemode
+
+    def value(cell):
+        if cell.ctype == xlrd.XL_CELL_EMPTY:
+            return ""
+
+        return show(cell.ctype, cell.value, datemode)
+
+    for (_x, cells) in sheet.rows_g(row_start):
+        if where and not all(p(value(cells[y])) for y, p in where):
+            continue
+
+        if columns is None:
+            yield [value(c) for c in cells]
+        else:
+            yield [value(cells[y]) for y in columns]
+
+
+def sheet_rows_g(sheet, row_start=0, row_end=None):
+    """Yields (row index, cells in the row) of rows in [row_start, row_end).
+    Rows of .xlsx sheets are read in streaming.
+    """
+    if hasattr(sheet, "rows_g"):
+        for row in sheet.rows_g(row_start, row_end):
+            yield row
+        return
+
+    if row_end is None:
+        row_end = sheet.nrows
+
+    for x in xrange(row_start, row_end):
+        yield (x, sheet.row(x))
+
+
+# Column arrays:
+def numpy_module():
+    """Returns numpy module or raises RuntimeError if it is not available.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("NumPy support is disabled as numpy module not found.")
+
+    return numpy
+
+
+EMPTY_TYPES = (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK)
+NUMBER_TYPES = set((xlrd.XL_CELL_NUMBER, xlrd.XL_CELL_BOOLEAN))
+DATE_TYPES = set((xlrd.XL_CELL_DATE, ))
+
+# Epochs of date values for each datemode. Dates before 1900-03-01 are off by
+# a day in datemode 0 as Excel treats 1900 as a leap year.
+DATE_EPOCHS = ("1899-12-30", "1904-01-01")
+
+
+def sheet_columns(sheet, columns, row_start=0, row_end=None):
+    """Returns lists of (cell types, cell values) of each column in rows in
+    [row_start, row_end).
+
+    Columns are read at once with xlrd's col_types() and col_values(), or
+    transposed from rows read in streaming for .xlsx sheets.
+    """
+    if not hasattr(sheet, "rows_g"):
+        return [
+            (sheet.col_types(y, row_start, row_end),
+             sheet.col_values(y, row_start, row_end)) for y in columns
+        ]
+
+    ret = [([], []) for _y in columns]
+    for (_x, cells) in sheet.rows_g(row_start, row_end):
+        for ((types, values), y) in zip(ret, columns):
+            types.append(cells[y].ctype)
+            values.append(cells[y].value)
+
+    return ret
+
+
+def column_array(types, values, datemode=0):
+    """Returns an array of values in the column of the type of the values;
+    float64 for numbers, bool for booleans, datetime64[s] for dates, or
+    object (unicode) for texts and mixed types. Arrays of typed values are
+    masked arrays with the mask of empty cells if there are.
+
+    :param types: Cell types (xlrd.XL_CELL_*) of cells in the column
+    :param values: Raw cell values in the column, e.g. floats for dates
+
+    >>> (N, E, D) = (xlrd.XL_CELL_NUMBER, xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_DATE)
+    >>> a = column_array([N, E, N], [1.0, "", 2.5])
+    >>> a.dtype, a.tolist(), a.mask.tolist()
+    (dtype('float64'), [1.0, None, 2.5], [False, True, False])
+    >>> a = column_array([D, D], [40909.0, 40909.5])
+    >>> a.dtype, [str(d) for d in a.tolist()]
+    (dtype('<M8[s]'), ['2012-01-01 00:00:00', '2012-01-01 12:00:00'])
+    >>> [str(d) for d in column_array([D, D], [40909.0, 40909.5], 1).tolist()]
+    ['2016-01-02 00:00:00', '2016-01-02 12:00:00']
+    >>> a = column_array([N, xlrd.XL_CELL_TEXT, D, E, xlrd.XL_CELL_ERROR],
+    ...                  [1.0, u"a", 40909.0, "", 0x07])
+    >>> a.dtype, a.tolist()
+    (dtype('O'), [1.0, u'a', (2012, 1, 1, 0, 0, 0), None, '#DIV/0!'])
+    """
+    numpy = numpy_module()
+
+    types = numpy.asarray(types, dtype=numpy.int8)
+    values = numpy.array(values, dtype=object)
+
+    empty = numpy.in1d(types, EMPTY_TYPES)
+    vtypes = set(numpy.unique(types[~empty]))
+
+    if vtypes == set((xlrd.XL_CELL_BOOLEAN, )):
+        dtype = bool
+    elif vtypes and (vtypes <= NUMBER_TYPES or vtypes == DATE_TYPES):
+        dtype = numpy.float64
+    else:
+        dtype = None
+
+    if dtype is not None:
+        arr = numpy.zeros(len(values), dtype=dtype)
+        arr[~empty] = values[~empty].astype(dtype)
+
+        if xlrd.XL_CELL_DATE in vtypes:
+            secs = numpy.round(arr * 86400).astype(numpy.int64)
+            arr = numpy.datetime64(DATE_EPOCHS[datemode], "s") + \
+                secs.astype("timedelta64[s]")
+
+        if empty.any():
+            return numpy.ma.masked_array(arr, mask=empty)
+
+        return arr
+
+    # Texts and mixed types:
+    values[empty] = None
+    for x in numpy.flatnonzero(numpy.in1d(types,
+            (xlrd.XL_CELL_DATE, xlrd.XL_CELL_ERROR))):
+        values[x] = show(types[x], values[x], datemode)
+
+    return values
+
+
+def sheet_column_arrays(sheet, row_start=1, row_end=None, columns=None):
+    """Returns arrays of values in each column of the sheet, see
+    column_array().
+
+    :param row_start: Index of the row to start reading from, next to headers
+    :param row_end: Index of the row to stop reading at, or None
+    :param columns: Indices of columns to read. All columns by default.
+    """
+    if columns is None:
+        columns = range(0, sheet.ncols)
+
+    datemode = sheet.book.datemode
+
+    return [
+        column_array(types, values, datemode) for (types, values) in
+            sheet_columns(sheet, columns, row_start, row_end)
+    ]
+
+
+def spec_column_arrays_g(specfile, filepath):
+    """Yields (table name, column names, column arrays) of the data range of
+    each sheet in the xlsto spec, see xlstools.xlsto and column_array().
+
+    Rows of which the marker cell is empty are skipped as xlsto does.
+    """
+    import xlstools.xlsto as XT
+
+    numpy = numpy_module()
+
+    for filespec in XT.load_specs(specfile):
+        book = open_workbook(filepath)
+
+        for (idx, sheetspec) in enumerate(filespec['sheets']):
+            sheet = book.sheet_by_index(idx)
+
+            (rows, cols, midx, keynames) = XT.sheet_data_range(sheet, sheetspec)
+            columns = range(cols[0], cols[1] + 1)
+
+            data = sheet_columns(sheet, [midx] + columns, *rows)
+            keep = numpy.array([XT.marked(v) for v in data[0][1]], dtype=bool)
+
+            arrays = [
+                column_array(numpy.asarray(types)[keep],
+                    numpy.asarray(values, dtype=object)[keep], book.datemode)
+                for (types, values) in data[1:]
+            ]
+
+            yield (sheetspec['table_name'], keynames, arrays)
 
 
 def normalize_key(key_str):
@@ -0,0 +1,394 @@
+#
+# Streaming reader of Excel 2007+ (.xlsx) files.
+#
+# Copyright (C) 2012 Satoru SATOH <satoru.satoh at gmail.com>
+# License: MIT
+#
+"""Read .xlsx files with constant memory.
+
+Rows are read from the sheet XML incrementally with iterparse each time
+these are iterated and processed rows are discarded, so that memory usage
+does not grow with the number of rows. Shared strings and styles are read
+once when the workbook is opened.
+
+Books and sheets provide a subset of xlrd's API used in this package and
+cells are xlrd's Cell objects, so that these can be processed in the same
+way as .xls files are. Use Sheet.rows_g() to read rows in streaming; random
+access to cells (Sheet.row(), Sheet.cell_value(), etc.) reads rows from the
+top of the sheet again and should be used only for the first rows, e.g.
+headers.
+"""
+import cStringIO as StringIO
+import posixpath
+import re
+import xlrd
+import zipfile
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+# Built-in number formats of dates and times:
+DATE_FORMAT_IDS = set(range(14, 23) + range(27, 37) + range(45, 48) +
+    range(50, 59))
+
+ERROR_CODES = dict((v, k) for k, v in xlrd.error_text_from_code.iteritems())
+
+
+def is_xlsx(filename=None, file_contents=None):
+    """.xlsx files are zip archives while .xls files are not.
+    """
+    if file_contents is not None:
+        return file_contents[:4] == "PK\x03\x04"
+
+    return zipfile.is_zipfile(filename)
+
+
+def localname(tag):
+    """
+    >>> localname("{http://schemas.openxmlformats.org/spreadsheetml/2006/main}row")
+    'row'
+    """
+    return tag.rsplit("}", 1)[-1]
+
+
+def col_index(ref):
+    """Returns the column index of the cell reference.
+
+    >>> col_index("A1"), col_index("Z10"), col_index("AB3")
+    (0, 25, 27)
+    """
+    idx = 0
+    for c in ref:
+        if not c.isalpha():
+            break
+        idx = idx * 26 + ord(c.upper()) - ord("A") + 1
+
+    return idx - 1
+
+
+def dimension(ref):
+    """Returns (nrows, ncols) from the dimension of the sheet.
+
+    >>> dimension("A1:E100"), dimension("B2:C3")
+    ((100, 5), (3, 3))
+    >>> dimension("A1")
+    """
+    m = re.match(r"^[A-Z]+\d+:([A-Z]+)(\d+)$", ref or "")
+    if not m:
+        return None
+
+    return (int(m.group(2)), col_index(m.group(1)) + 1)
+
+
+def is_date_format(code):
+    """
+    >>> is_date_format("yyyy/mm/dd"), is_date_format("[$-411]ge.m.d")
+    (True, True)
+    >>> is_date_format("0.00"), is_date_format('#,##0"days"')
+    (False, False)
+    """
+    code = re.sub(r'"[^"]*"|\\.|\[[^\]hHmMsS]*\]', "", code)
+    return bool(re.search(r"[ymdhsYMDHSge]", code)) and code != "General"
+
+
+def text(elem):
+    """Returns texts in the element except for phonetic (rPh) runs.
+    """
+    if localname(elem.tag) == "rPh":
+        return ""
+
+    ret = localname(elem.tag) == "t" and (elem.text or "") or ""
+    return ret + "".join(text(e) for e in elem)
+
+
+class Book(object):
+
+    def __init__(self, filename=None, file_contents=None):
+        if file_contents is not None:
+            filename = StringIO.StringIO(file_contents)
+
+        self._zip = zipfile.ZipFile(filename)
+        self._in_memory = file_contents is not None
+        self._sheets = []
+        self.datemode = 0
+
+        self._load_workbook()
+        self.shared_strings = self._load_shared_strings()
+        self.date_styles = self._load_date_styles()
+
+    def _parse(self, path):
+        return ET.parse(self.open(path)).getroot()
+
+    def _load_workbook(self):
+        rels = dict()
+        for rel in self._parse("xl/_rels/workbook.xml.rels"):
+            target = rel.get("Target")
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join("xl", target))
+            rels[rel.get("Id")] = target
+
+        for elem in self._parse("xl/workbook.xml").getiterator():
+            tag = localname(elem.tag)
+            if tag == "workbookPr":
+                if elem.get("date1904") in ("1", "true"):
+                    self.datemode = 1
+            elif tag == "sheet":
+                path = rels[elem.get("{%s}id" % NS_R)]
+                self._sheets.append(Sheet(self, elem.get("name"), path))
+
+    def _load_shared_strings(self):
+        if "xl/sharedStrings.xml" not in self._zip.namelist():
+            return []
+
+        ret = []
+        for (_event, elem) in ET.iterparse(self.open("xl/sharedStrings.xml")):
+            if localname(elem.tag) == "si":
+                ret.append(unicode(text(elem)))
+                elem.clear()
+
+        return ret
+
+    def _load_date_styles(self):
+        """Returns the set of indices of cell styles for dates.
+        """
+        if "xl/styles.xml" not in self._zip.namelist():
+            return set()
+
+        root = self._parse("xl/styles.xml")
+        date_fmts = set(DATE_FORMAT_IDS)
+        ret = set()
+
+        for elem in root:
+            tag = localname(elem.tag)
+            if tag == "numFmts":
+                for fmt in elem:
+                    if is_date_format(fmt.get("formatCode", "")):
+                        date_fmts.add(int(fmt.get("numFmtId")))
+            elif tag == "cellXfs":
+                for (idx, xf) in enumerate(elem):
+                    if int(xf.get("numFmtId", 0)) in date_fmts:
+                        ret.add(idx)
+
+        return ret
+
+    def open(self, path):
+        # Members of the archive in memory share the file object and cannot
+        # be read in parallel.
+        if self._in_memory:
+            return StringIO.StringIO(self._zip.read(path))
+
+        return self._zip.open(path)
+
+    @property
+    def nsheets(self):
+        return len(self._sheets)
+
+    def sheets(self):
+        return list(self._sheets)
+
+    def sheet_names(self):
+        return [s.name for s in self._sheets]
+
+    def sheet_by_index(self, idx):
+        return self._sheets[idx]
+
+    def sheet_by_name(self, name):
+        for s in self._sheets:
+            if s.name == name:
+                return s
+
+        raise xlrd.XLRDError("No sheet named <%r>" % name)
+
+
+class Sheet(object):
+
+    def __init__(self, book, name, path):
+        self.book = book
+        self.name = name
+        self.path = path
+        self._dimension = None
+        self._row = (None, None)  # Cache of the last row read: (rowx, cells)
+
+    def cell(self, elem, ns=""):
+        """Make a Cell object from the cell (c) element.
+
+        :param ns: Namespace prefix of tags, e.g. "{http://...}"
+        """
+        (ctype, value) = (elem.get("t", "n"), None)
+
+        for e in elem:
+            if e.tag == ns + "v":
+                value = e.text
+            elif e.tag == ns + "is":
+                value = text(e)
+
+        if value is None:
+            return xlrd.sheet.Cell(xlrd.XL_CELL_EMPTY, u"")
+
+        if ctype == "s":
+            return xlrd.sheet.Cell(xlrd.XL_CELL_TEXT,
+                self.book.shared_strings[int(value)])
+        elif ctype in ("str", "inlineStr"):
+            return xlrd.sheet.Cell(xlrd.XL_CELL_TEXT, unicode(value))
+        elif ctype == "b":
+            return xlrd.sheet.Cell(xlrd.XL_CELL_BOOLEAN, int(value))
+        elif ctype == "e":
+            return xlrd.sheet.Cell(xlrd.XL_CELL_ERROR,
+                ERROR_CODES.get(value, 0x2a))
+        elif int(elem.get("s", 0)) in self.book.date_styles:
+            return xlrd.sheet.Cell(xlrd.XL_CELL_DATE, float(value))
+        else:
+            return xlrd.sheet.Cell(xlrd.XL_CELL_NUMBER, float(value))
+
+    def _rows_g(self, row_start=0, row_end=None):
+        """Yields (row index, cells in the row) of rows in the sheet XML read
+        in streaming. Cells are not padded and empty rows not in the XML are
+        not yielded.
+        """
+        (parent, rowx, ns) = (None, -1, None)
+
+        for (event, elem) in ET.iterparse(self.book.open(self.path),
+                ("start", "end")):
+            if ns is None:  # Root (worksheet) element.
+                ns = elem.tag[:-len(localname(elem.tag))]
+                row_tag = ns + "row"
+
+            if event == "start":
+                if localname(elem.tag) == "sheetData":
+                    parent = elem
+                continue
+
+            if elem.tag != row_tag:
+                continue
+
+            r = int(elem.get("r", rowx + 2)) - 1
+            if row_end is not None and r >= row_end:
+                break
+
+            if r >= row_start:
+                empty = xlrd.sheet.Cell(xlrd.XL_CELL_EMPTY, u"")
+                cells = []
+                for c in elem:
+                    ref = c.get("r")
+                    y = col_index(ref) if ref else len(cells)
+                    if y > len(cells):
+                        cells += [empty] * (y - len(cells))
+                    cells.append(self.cell(c, ns))
+
+                yield (r, cells)
+
+            rowx = r
+            parent.clear()  # Discard processed rows.
+
+    def rows_g(self, row_start=0, row_end=None):
+        """Yields (row index, cells in the row) read in streaming. Empty rows
+        are yielded also and rows are padded to have ncols cells.
+
+        :param row_start: Index of the row to start reading from
+        :param row_end: Index of the row to stop reading at, or None
+
+        >>> rows = '<row r="1"><c r="A1"><v>1</v></c><c r="C1"><v>3</v></c>'
+        >>> rows += '</row><row r="3"><c r="B3" t="inlineStr"><is><t>b</t>'
+        >>> rows += '</is></c></row>'
+        >>> for ref in ("A1:C3", None):
+        ...     sheet = open_workbook(file_contents=_xlsx_data(rows, ref))
+        ...     [(x, [c.value for c in cs]) for (x, cs) in sheet.sheet_by_index(0).rows_g()]
+        [(0, [1.0, u'', 3.0]), (1, [u'', u'', u'']), (2, [u'', u'b', u''])]
+        [(0, [1.0, u'', 3.0]), (1, [u'', u'', u'']), (2, [u'', u'b', u''])]
+        """
+        ncols = self.ncols  # The sheet is scanned if the dimension is not found.
+        empty = xlrd.sheet.Cell(xlrd.XL_CELL_EMPTY, u"")
+        rowx = row_start - 1
+
+        for (r, cells) in self._rows_g(row_start, row_end):
+            for x in xrange(rowx + 1, r):
+                yield (x, [empty] * ncols)  # Empty rows skipped in XML.
+
+            if len(cells) < ncols:
+                cells += [empty] * (ncols - len(cells))
+
+            yield (r, cells)
+            rowx = r
+
+    def _read_dimension(self):
+        """Returns (nrows, ncols) from the dimension element, which is before
+        sheetData if any, or () if it is not found.
+        """
+        for (_event, elem) in ET.iterparse(self.book.open(self.path),
+                ("start", )):
+            tag = localname(elem.tag)
+            if tag == "dimension":
+                return dimension(elem.get("ref")) or ()
+            elif tag == "sheetData":
+                break
+
+        return ()
+
+    def _dimensions(self):
+        if self._dimension is None:
+            self._dimension = self._read_dimension()
+
+        if not self._dimension:  # Not found in the sheet XML.
+            (nrows, ncols) = (0, 0)
+            for (x, cells) in self._rows_g():
+                (nrows, ncols) = (x + 1, max(ncols, len(cells)))
+            self._dimension = (nrows, ncols)
+
+        return self._dimension
+
+    @property
+    def nrows(self):
+        return self._dimensions()[0]
+
+    @property
+    def ncols(self):
+        return self._dimensions()[1]
+
+    def row(self, rowx):
+        if self._row[0] != rowx:
+            cells = [xlrd.sheet.Cell(xlrd.XL_CELL_EMPTY, u"")] * self.ncols
+            for (_x, cells) in self.rows_g(rowx, rowx + 1):
+                pass
+            self._row = (rowx, cells)
+
+        return self._row[1]
+
+    def cell_type(self, rowx, colx):
+        return self.row(rowx)[colx].ctype
+
+    def cell_value(self, rowx, colx):
+        return self.row(rowx)[colx].value
+
+
+def open_workbook(filename=None, file_contents=None):
+    return Book(filename, file_contents)
+
+
+def _xlsx_data(sheet_data, ref=None):
+    """Make .xlsx data has a sheet with the rows (sheetData) for tests.
+    """
+    ns = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    dim = ref and '<dimension ref="%s"/>' % ref or ""
+
+    out = StringIO.StringIO()
+    zf = zipfile.ZipFile(out, "w")
+    zf.writestr("xl/workbook.xml", '<workbook xmlns="%s" xmlns:r="%s">'
+        '<sheets><sheet name="S" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>' % (ns, NS_R))
+    zf.writestr("xl/_rels/workbook.xml.rels", '<Relationships xmlns="http://'
+        'schemas.openxmlformats.org/package/2006/relationships"><Relationship'
+        ' Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>')
+    zf.writestr("xl/worksheets/sheet1.xml", '<worksheet xmlns="%s">%s'
+        '<sheetData>%s</sheetData></worksheet>' % (ns, dim, sheet_data))
+    zf.close()
+
+    return out.getvalue()
+
+# vim:sw=4:ts=4:et: